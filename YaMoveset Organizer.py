@@ -1,5 +1,10 @@
 #!/usr/local/bin/python3.6
-from collections import defaultdict
+# Startup is timed from before anything else is imported
+import time
+STARTED = time.perf_counter()
+
+import argparse
+import multiprocessing
 import os
 from pathlib import Path
 import re
@@ -8,16 +13,15 @@ import traceback
 
 from pubsub import pub
 import wx
-from wx.lib.dialogs import MultiMessageDialog
 
-from pyxenoverse.bac import BAC
-from pyxenoverse.bdm import BDM
-from pyxenoverse.ean import EAN
-from pyxenoverse.gui import create_backup
+from yamoveset import perf
+from yamoveset.cache import FileCache
 from yamoveset.panels.main import MainPanel
 from yamoveset.panels.side import SidePanel
-from yamoveset.dlg.combo import ComboInfoDialog
 
+# Everything importing the parsers and every dialog is imported where it is first used, so the window shows up
+# before any of it is loaded. benchmarks/startup.py checks that it stays that way.
+IMPORTED = time.perf_counter()
 VERSION = '0.3.0'
 
 
@@ -26,19 +30,37 @@ class MainWindow(wx.Frame):
         sys.excepthook = self.exception_hook
         self.locale = wx.Locale(wx.LANGUAGE_ENGLISH)
         self.copied = None
+        self.executor = None
+        self.loader = None
+        self.loading_panel = None
+        self.load_operation = None
+        self.saver = None
+        self.cache = FileCache()
+        self.library_dialog = None
+        self.performance_dialog = None
 
         # A "-1" in the size parameter instructs wxWidgets to use the default size.
         # In this case, we select 200px width and the default height.
         wx.Frame.__init__(self, parent, title=title, size=(1200, 800))
-        self.statusbar = self.CreateStatusBar()  # A Statusbar in the bottom of the window
+        self.statusbar = self.CreateStatusBar(2)  # A Statusbar in the bottom of the window
+        self.statusbar.SetStatusWidths([-1, 250])
+        self.gauge = wx.Gauge(self.statusbar, style=wx.GA_HORIZONTAL | wx.GA_SMOOTH)
+        self.gauge.Hide()
+        self.statusbar.Bind(wx.EVT_SIZE, self.on_statusbar_size)
 
         # Setting up the menu.
         file_menu = wx.Menu()
         file_menu.Append(wx.ID_ABOUT)
+        file_menu.Append(wx.ID_CANCEL, '&Cancel Loading/Saving\tEsc')
+        compact_item = file_menu.Append(wx.ID_ANY, 'C&ompact Moveset', 'Remove unused animations and hitboxes')
+        search_item = file_menu.Append(wx.ID_ANY, '&Search Movesets...\tCtrl+F', 'Search indexed movesets')
+        clear_cache_item = file_menu.Append(wx.ID_ANY, 'C&lear Cache', 'Delete the cached copies of parsed files')
+        restore_item = file_menu.Append(wx.ID_ANY, '&Restore Backup...', 'Go back to the files of an earlier save')
         file_menu.Append(wx.ID_EXIT)
 
         help_menu = wx.Menu()
         help_menu.Append(wx.ID_HELP, '&Combo info\tF1')
+        performance_item = help_menu.Append(wx.ID_ANY, '&Performance...', 'Timings of the last operations')
 
         # Creating the menubar.
         menu_bar = wx.MenuBar()
@@ -53,13 +75,22 @@ class MainWindow(wx.Frame):
         pub.subscribe(self.load_side_moveset, 'load_side_moveset')
         pub.subscribe(self.save_moveset, 'save_moveset')
         pub.subscribe(self.set_status_bar, 'set_status_bar')
+        perf.recorder.listeners.append(lambda operation: wx.CallAfter(self.on_operation, operation))
 
         # Events
         self.Bind(wx.EVT_MENU, self.on_about, id=wx.ID_ABOUT)
         self.Bind(wx.EVT_MENU, self.on_help, id=wx.ID_HELP)
         self.Bind(wx.EVT_MENU, self.on_exit, id=wx.ID_EXIT)
+        self.Bind(wx.EVT_MENU, self.on_cancel_loading, id=wx.ID_CANCEL)
+        self.Bind(wx.EVT_MENU, self.on_compact, compact_item)
+        self.Bind(wx.EVT_MENU, self.on_clear_cache, clear_cache_item)
+        self.Bind(wx.EVT_MENU, self.on_restore_backup, restore_item)
+        self.Bind(wx.EVT_MENU, self.on_search, search_item)
+        self.Bind(wx.EVT_MENU, self.on_performance, performance_item)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
         accelerator_table = wx.AcceleratorTable([
             (wx.ACCEL_NORMAL, wx.WXK_F1, wx.ID_HELP),
+            (wx.ACCEL_NORMAL, wx.WXK_ESCAPE, wx.ID_CANCEL),
         ])
         self.SetAcceleratorTable(accelerator_table)
 
@@ -73,15 +104,24 @@ class MainWindow(wx.Frame):
         self.sizer.Add(self.side_panel, 1, wx.ALL|wx.EXPAND)
         self.SetSizer(self.sizer)
         self.SetAutoLayout(1)
-        self.help = ComboInfoDialog(self)
+        self.help = None
 
         self.sizer.Layout()
         self.Show()
+        self.startup_operation()
 
         if filename:
             self.load_main_moveset(dirname, filename)
 
+    def startup_operation(self):
+        operation = perf.begin('Startup')
+        operation.start = STARTED
+        operation.add_span('imports', IMPORTED - STARTED)
+        operation.add_span('window', time.perf_counter() - IMPORTED)
+        perf.end(operation)
+
     def exception_hook(self, e, value, trace):
+        from wx.lib.dialogs import MultiMessageDialog
         with MultiMessageDialog(self, '', 'Error', ''.join(traceback.format_exception(e, value, trace)), wx.OK) as dlg:
             dlg.ShowModal()
 
@@ -92,25 +132,34 @@ class MainWindow(wx.Frame):
             dlg.ShowModal() # Shows it
 
     def on_help(self, _):
+        if self.help is None:
+            from yamoveset.dlg.combo import ComboInfoDialog
+            self.help = ComboInfoDialog(self)
         self.help.Show()
 
     def on_exit(self, _):
         self.Close(True)  # Close the frame.
 
-    def file_not_found_dialog(self, filetype, skip=False):
-        msg = f'No Valid {filetype} file found'
-        if skip:
-            msg += ' but skipping anyway.\n' \
-                   'WARNING: May be unable to copy/paste certain moves moves that require this file'
-        with wx.MessageDialog(self, msg, 'Warning') as dlg:
-            dlg.ShowModal()
+    def on_close(self, event):
+        if self.loader is not None:
+            self.loader.cancel()
+        if self.saver is not None:
+            # Let it finish replacing the files if it got that far, the moveset is never left half saved
+            self.saver.cancel()
+            self.saver.wait()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        event.Skip()
+
+    def on_statusbar_size(self, event):
+        rect = self.statusbar.GetFieldRect(1)
+        self.gauge.SetPosition(rect.GetPosition())
+        self.gauge.SetSize(rect.GetSize())
+        event.Skip()
 
-    def file_invalid_dialog(self, path, filetype, skip=False):
-        msg = f'{path.name} is not a valid {filetype}'
-        if skip:
-            msg += ' but skipping anyway.\n' \
-                   'WARNING: May be unable to copy/paste certain moves moves that require this file'
-        with wx.MessageDialog(self, msg, 'Warning') as dlg:
+    def file_not_found_dialog(self, filetype, skip=False):
+        from yamoveset.moveset import file_not_found_message
+        with wx.MessageDialog(self, file_not_found_message(filetype, skip), 'Warning') as dlg:
             dlg.ShowModal()
 
     def open_file_dialog(self, panel):
@@ -122,13 +171,10 @@ class MainWindow(wx.Frame):
             self.open_folder(panel)
 
     def open_folder(self, panel):
+        from yamoveset.moveset import find_character_codes
+
         # Attempt to get Character Code
-        bac_files = Path(panel.dirname).glob('*_PLAYER.bac')
-        character_codes = []
-        for f in bac_files:
-            match = re.match(r'(\w{3})_PLAYER.bac', f.name)
-            if match:
-                character_codes.append(match[1])
+        character_codes = find_character_codes(panel.dirname)
 
         # Did we get Character codes
         if not character_codes:
@@ -162,50 +208,111 @@ class MainWindow(wx.Frame):
             return
         self.load_files(dirname, match[1], panel)
 
-    def load_single_file(self, path, obj_class, filetype=None, skip=False):
-        if not filetype:
-            filetype = obj_class.__name__
-        if not path.is_file():
-            self.file_not_found_dialog(filetype, skip)
-            return None
-
-        new_obj = obj_class()
-
-        if not new_obj.load(str(path)):
-            self.file_invalid_dialog(path, filetype, skip)
-            return None
-
-        return new_obj
-
     def load_files(self, path, code, panel):
-        new_bac = self.load_single_file(Path(os.path.join(path, f'{code}_PLAYER.bac')), BAC)
-        if not new_bac:
+        from yamoveset.moveset import MOVESET_FILES, MovesetLoader
+
+        # Parse the files in worker processes so the window doesn't freeze, the parsers hold the GIL
+        if self.loader is not None:
+            self.cancel_loading()
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=len(MOVESET_FILES))
+        self.loading_panel = panel
+        self.load_operation = perf.begin(f'Load {code}')
+        self.loader = MovesetLoader(
+            path, code, self.executor, callback=lambda loader: wx.CallAfter(self.on_load_progress, loader),
+            cache=self.cache, lazy=True, operation=self.load_operation)
+        self.gauge.SetRange(self.loader.total())
+        self.gauge.SetValue(0)
+        self.gauge.Show()
+        self.statusbar.SetStatusText(f'Loading {code} moveset... (Esc to cancel)')
+
+    def on_load_progress(self, loader):
+        from concurrent.futures.process import BrokenProcessPool
+        from wx.lib.dialogs import MultiMessageDialog
+
+        # Ignore stragglers from a cancelled or replaced load
+        if loader is not self.loader or loader.cancelled:
             return
-        new_ean = self.load_single_file(Path(os.path.join(path, f'{code}.ean')), EAN)
-        if not new_ean:
+        self.gauge.SetValue(loader.progress())
+        if not loader.done():
+            return
+        self.loader = None
+        self.gauge.Hide()
+
+        # The operation ends however the load went, a parser error still goes on to the error dialog
+        operation, self.load_operation = self.load_operation, None
+        try:
+            moveset, warnings = loader.result()
+        except BrokenProcessPool:
+            # A worker process died, the pool is unusable after that so the next load gets a new one
+            operation.name += ' (failed)'
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            self.statusbar.SetStatusText(f'Failed to load {loader.code} moveset, a loader process stopped. '
+                                         f'Please try again')
+            return
+        except BaseException:
+            operation.name += ' (failed)'
+            self.statusbar.SetStatusText(f'Failed to load {loader.code} moveset')
+            raise
+        finally:
+            perf.end(operation)
+        if warnings:
+            with MultiMessageDialog(self, 'The following problems were found while loading the moveset:',
+                                    'Warning', '\n\n'.join(warnings), wx.OK) as dlg:
+                dlg.ShowModal()
+        if moveset is None:
+            self.statusbar.SetStatusText(f'Failed to load {loader.code} moveset')
             return
 
-        # Optional
-        new_bdm = self.load_single_file(Path(os.path.join(path, f'{code}_PLAYER.bdm')), BDM, skip=True)
-        new_cam_ean = self.load_single_file(
-            Path(os.path.join(path, f'{code}.cam.ean')), EAN, filetype='CAM.EAN', skip=True)
-
-        panel.code = code
-        panel.bac = new_bac
-        panel.bdm = new_bdm
-        panel.ean = new_ean
-        panel.cam_ean = new_cam_ean
+        panel = self.loading_panel
+        panel.code = moveset.code
+        panel.bac = moveset.bac
+        panel.bdm = moveset.bdm
+        panel.ean = moveset.ean
+        panel.cam_ean = moveset.cam_ean
+        panel.hashes = moveset.hashes
         panel.build_tree()
-        panel.name.SetLabel(code)
+        panel.name.SetLabel(moveset.code)
         panel.Layout()
-        self.main_panel.links = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
-        self.statusbar.SetStatusText(f'Loaded {code} moveset')
+        if panel is self.main_panel:
+            self.main_panel.session.reset_target(moveset.dirname)
+        else:
+            self.main_panel.session.reset()
+        self.statusbar.SetStatusText(f'Loaded {moveset.code} moveset')
+
+    def on_cancel_loading(self, _):
+        if self.saver is not None:
+            self.saver.cancel()
+            self.statusbar.SetStatusText(f'Cancelling save of {self.saver.code} moveset...')
+            return
+        if self.loader is None:
+            return
+        self.cancel_loading()
+        self.gauge.Hide()
+        self.statusbar.SetStatusText('Loading cancelled')
+
+    def cancel_loading(self):
+        self.loader.cancel()
+        self.loader = None
+        self.load_operation.name += ' (cancelled)'
+        perf.end(self.load_operation)
+        self.load_operation = None
+
+    def saving(self):
+        if self.saver is None:
+            return False
+        self.statusbar.SetStatusText(f'Please wait until the {self.saver.code} moveset is saved')
+        return True
 
     def open_main_moveset(self):
-        self.open_file_dialog(self.main_panel)
+        if not self.saving():
+            self.open_file_dialog(self.main_panel)
 
     def load_main_moveset(self, dirname, filename):
-        self.open_file(dirname, filename, self.main_panel)
+        if not self.saving():
+            self.open_file(dirname, filename, self.main_panel)
 
     def open_side_moveset(self):
         self.open_file_dialog(self.side_panel)
@@ -214,6 +321,14 @@ class MainWindow(wx.Frame):
         self.open_file(dirname, filename, self.side_panel)
 
     def save_moveset(self):
+        from yamoveset.backups import backup_moveset
+        from yamoveset.moveset import MovesetSaver
+
+        if self.saving():
+            return
+        if self.loader is not None and self.loading_panel is self.main_panel:
+            self.statusbar.SetStatusText('Please wait until the moveset is loaded')
+            return
         with wx.DirDialog(self, 'Choose directory to save moveset to', self.main_panel.dirname,
                           wx.DD_DEFAULT_STYLE | wx.DD_DIR_MUST_EXIST) as dlg:
             if dlg.ShowModal() != wx.ID_OK:
@@ -231,36 +346,171 @@ class MainWindow(wx.Frame):
                 with wx.MessageDialog(self, 'Character code can only consist of alphanumeric values') as warn:
                     warn.ShowModal()
 
-        if self.main_panel.bac is not None:
-            bac_filename = f'{code}_PLAYER.bac'
-            create_backup(path, bac_filename)
-            self.main_panel.bac.save(os.path.join(path, bac_filename))
-        if self.main_panel.bdm is not None:
-            bdm_filename = f'{code}_PLAYER.bdm'
-            create_backup(path, bdm_filename)
-            self.main_panel.bdm.save(os.path.join(path, bdm_filename))
-        if self.main_panel.ean is not None:
-            ean_filename = f'{code}.ean'
-            create_backup(path, ean_filename)
-            self.main_panel.ean.save(os.path.join(path, ean_filename))
-        if self.main_panel.cam_ean is not None:
-            cam_filename = f'{code}.cam.ean'
-            create_backup(path, cam_filename)
-            self.main_panel.cam_ean.save(os.path.join(path, cam_filename))
-
-        msg = f'Saved {code} moveset successfully!'
+        # Only files that changed since they were loaded or last saved here need to be written. They are written
+        # on a worker thread, the moveset can be browsed but not edited meanwhile.
+        session = self.main_panel.session
+        self.saver = MovesetSaver(
+            self.main_panel, path, code, session.files_to_save(path, code), backup_moveset, session.dirty_entries,
+            callback=lambda saver: wx.CallAfter(self.on_save_progress, saver), operation=perf.begin(f'Save {code}'))
+        self.main_panel.set_saving(True)
+        self.gauge.SetRange(max(self.saver.total(), 1))
+        self.gauge.SetValue(0)
+        self.gauge.Show()
+        self.statusbar.SetStatusText(f'Saving {code} moveset... (Esc to cancel)')
+
+    def on_save_progress(self, saver):
+        from wx.lib.dialogs import MultiMessageDialog
+        from yamoveset.moveset import MOVESET_FILES, MOVESET_FILENAMES, LazyEanError
+
+        # The first callback to see the save done finishes it, the ones still queued after that are ignored
+        if saver is not self.saver:
+            return
+        self.gauge.SetValue(saver.progress())
+        if not saver.done():
+            filename = MOVESET_FILENAMES[saver.written[-1]].format(code=saver.code)
+            self.statusbar.SetStatusText(
+                f'Saving {saver.code} moveset... {saver.progress()}/{saver.total()} ({filename} written)')
+            return
+        self.saver = None
+        self.gauge.Hide()
+        self.main_panel.set_saving(False)
+
+        if saver.error is not None:
+            saver.operation.name += ' (failed)'
+            perf.end(saver.operation)
+            self.statusbar.SetStatusText(f'Failed to save {saver.code} moveset, no files were changed')
+            error = saver.error
+            # Expected when a file changed on disk, that only needs the message
+            if isinstance(error, LazyEanError):
+                with wx.MessageDialog(self, f'The moveset could not be saved: {error}', 'Error') as dlg:
+                    dlg.ShowModal()
+                return
+            with MultiMessageDialog(self, 'The moveset could not be saved:', 'Error', ''.join(
+                    traceback.format_exception(type(error), error, error.__traceback__)), wx.OK) as dlg:
+                dlg.ShowModal()
+            return
+        if saver.saved is None:
+            saver.operation.name += ' (cancelled)'
+            perf.end(saver.operation)
+            self.statusbar.SetStatusText('Saving cancelled, no files were changed')
+            return
+        perf.end(saver.operation)
+        self.main_panel.session.mark_saved(saver.dirname, saver.code)
+
+        saved = saver.saved
+        msg = f'Saved {saver.code} moveset successfully!'
+        if not saved:
+            msg += ' (no changes)'
+        elif len(saved) < len(MOVESET_FILES):
+            msg += f' ({", ".join(saved)})'
         self.statusbar.SetStatusText(msg)
         with wx.MessageDialog(self, msg, '', wx.OK) as dlg:
             dlg.ShowModal()
 
+    def on_compact(self, _):
+        from yamoveset.moveset import MOVESET_FILES, LazyEanError
+
+        if self.main_panel.bac is None or self.saving():
+            return
+        with wx.MessageDialog(self, 'Remove all EAN/CAM.EAN animations and BDM entries that no BAC entry uses?\n'
+                                    'The remaining animations will be renumbered.',
+                              'Compact moveset', wx.YES | wx.NO) as dlg:
+            if dlg.ShowModal() != wx.ID_YES:
+                return
+        try:
+            with perf.operation('Compact'):
+                removed = self.main_panel.session.compact()
+        except LazyEanError as e:
+            with wx.MessageDialog(self, str(e), 'Error') as dlg:
+                dlg.ShowModal()
+            return
+        self.main_panel.update_history()
+        if not removed:
+            msg = 'Nothing to compact'
+        else:
+            code = self.main_panel.code
+            filenames = {attr: filename.format(code=code) for attr, filename, _, _, _ in MOVESET_FILES}
+            msg = 'Removed ' + ', '.join(f'{count} from {filenames[attr]}' for attr, count in removed.items())
+        self.statusbar.SetStatusText(msg)
+
+    def on_restore_backup(self, _):
+        from yamoveset.backups import BackupError, BackupStore
+
+        if self.main_panel.bac is None or self.saving():
+            return
+        # Where the moveset was loaded from or last saved to
+        dirname, code = self.main_panel.session.saved_as
+        store = BackupStore(dirname)
+        backups = store.backups(code)
+        if not backups:
+            with wx.MessageDialog(self, f'There are no backups of the {code} moveset in {dirname}', 'Restore backup',
+                                  wx.OK) as dlg:
+                dlg.ShowModal()
+            return
+        choices = [f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(backup.created))}  {backup.note}  '
+                   f'({", ".join(sorted(backup.files))})' for backup in backups]
+        with wx.SingleChoiceDialog(self, 'Which backup do you want to restore?', 'Restore backup', choices) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            backup = backups[dlg.GetSelection()]
+
+        msg = f'Replace the {code} moveset files in {dirname} with this backup and reload them?'
+        if self.main_panel.session.dirty:
+            msg += '\nChanges that were not saved will be lost.'
+        with wx.MessageDialog(self, msg, 'Restore backup', wx.YES | wx.NO) as dlg:
+            if dlg.ShowModal() != wx.ID_YES:
+                return
+        try:
+            with perf.operation('Restore backup'):
+                restored = store.restore(backup.id)
+        except (BackupError, OSError) as e:
+            with wx.MessageDialog(self, f'The backup could not be restored, no files were changed:\n{e}',
+                                  'Error') as dlg:
+                dlg.ShowModal()
+            return
+        self.load_files(dirname, code, self.main_panel)
+        self.statusbar.SetStatusText(f'Restored {", ".join(restored)}, reloading {code} moveset...')
+
+    def on_search(self, _):
+        if self.library_dialog is None:
+            from yamoveset.dlg.library import LibraryDialog
+            self.library_dialog = LibraryDialog(self)
+        self.library_dialog.Show()
+        self.library_dialog.Raise()
+
+    def on_clear_cache(self, _):
+        self.cache.clear()
+        self.statusbar.SetStatusText(f'Cleared {self.cache.dirname}')
+
+    def on_performance(self, _):
+        if self.performance_dialog is None:
+            from yamoveset.dlg.performance import PerformanceDialog
+            self.performance_dialog = PerformanceDialog(self)
+        self.performance_dialog.refresh()
+        self.performance_dialog.Show()
+        self.performance_dialog.Raise()
+
+    def on_operation(self, operation):
+        # The gauge covers the second field while loading
+        self.statusbar.SetStatusText(operation.summary(1), 1)
+        if self.performance_dialog is not None and self.performance_dialog.IsShown():
+            self.performance_dialog.refresh()
+
     def set_status_bar(self, text):
         self.statusbar.SetStatusText(text)
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='Copy/paste moves between movesets')
+    parser.add_argument('path', nargs='?', help='Moveset folder or file to open')
+    parser.add_argument('--profile', metavar='DIR', help='Write a cProfile and JSON trace of every operation to DIR')
+    args = parser.parse_args()
+    if args.profile:
+        perf.recorder.enable_profiling(args.profile)
     app = wx.App(False)
     dirname = filename = None
-    if len(sys.argv) > 1:
-        dirname, filename = os.path.split(sys.argv[1])
+    if args.path:
+        dirname, filename = os.path.split(args.path)
     frame = MainWindow(None, f"YaMoveset Organizer v{VERSION}", dirname, filename)
     app.MainLoop()
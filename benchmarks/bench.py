@@ -0,0 +1,313 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from yamoveset.batch import detect_code
+from yamoveset.cache import FileCache
+from yamoveset.clipboard import CopyBuffer
+from yamoveset.moveset import MOVESET_FILENAMES, MOVESET_FILES, MovesetLoader, load_moveset, save_moveset
+from yamoveset.session import MovesetSession, PasteError, new_links
+from pyxenoverse.bac.entry import Entry
+from pyxenoverse.bac.types.animation import Animation
+from pyxenoverse.bac.types.camera import Camera
+from pyxenoverse.bac.types.hitbox import Hitbox
+from pyxenoverse.bdm.entry import Entry as BdmEntry
+from pyxenoverse.ean.animation import Animation as EanAnimation
+
+# Sizes are ENTRIESxKEYFRAMES: how many times the template's BAC entries, animations, hitboxes and cameras are
+# repeated, and how many times denser every keyframe track gets
+DEFAULT_SIZES = ['1x1', '4x1', '4x4', '16x1']
+MULTI_PASTE = 10
+SOURCE_CODE = 'SRC'
+TARGET_CODE = 'TGT'
+
+
+def parse_size(text):
+    try:
+        scale, keyframes = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid size "{text}", expected ENTRIESxKEYFRAMES like 4x2')
+    if scale < 1 or keyframes < 1:
+        raise argparse.ArgumentTypeError(f'Invalid size "{text}", both factors have to be at least 1')
+    return text.lower(), scale, keyframes
+
+
+def shifted_links(entry, offsets):
+    # Links every character value of entry to the same value shifted by the offset of its file
+    links = new_links()
+    for item_type, v1 in entry.get_static_values().items():
+        offset = offsets.get(item_type, 0)
+        for entry_pair, v2 in v1.items():
+            for depend_value, values in v2.items():
+                links[item_type][entry_pair][depend_value].update((value, value + offset) for value in values)
+    return links
+
+
+def densify(animation, factor, variant):
+    # Stretches every track to factor times the keyframes by adding interpolated ones in between. variant nudges
+    # the values so the source and target animations don't come out identical.
+    for node in animation.nodes:
+        for track in node.keyframed_animations:
+            keyframes = []
+            for n, keyframe in enumerate(track.keyframes):
+                following = track.keyframes[n + 1] if n + 1 < len(track.keyframes) else None
+                for step in range(factor if following else 1):
+                    new = copy.copy(keyframe)
+                    new.frame = keyframe.frame * factor + step
+                    if step:
+                        weight = step / factor
+                        for component in 'xyzw':
+                            setattr(new, component, getattr(keyframe, component) * (1 - weight)
+                                    + getattr(following, component) * weight)
+                    if variant:
+                        new.x += variant * 1e-3
+                    keyframes.append(new)
+            track.keyframes = keyframes
+    if hasattr(animation, 'duration'):
+        animation.duration *= factor
+
+
+def scale_moveset(moveset, scale, keyframes, variant=0):
+    # Repeats the template's contents scale times. Repeated BAC entries point at the repeated animations, hitboxes
+    # and cameras of their own copy, so every copy is used.
+    offsets = {}
+    for item_type, attr in [(Animation, 'ean'), (Camera, 'cam_ean')]:
+        ean = getattr(moveset, attr)
+        if ean is None:
+            continue
+        originals = list(ean.animations)
+        offsets[item_type] = len(originals)
+        for animation in originals:
+            if keyframes > 1 or variant:
+                densify(animation, keyframes, variant)
+        for repeat in range(1, scale):
+            for animation in originals:
+                new = EanAnimation(ean)
+                new.paste(animation)
+                new.name = f'{animation.name}_{repeat}'
+                ean.animations.append(new)
+
+    if moveset.bdm is not None:
+        originals = list(moveset.bdm.entries)
+        offsets[Hitbox] = max((entry.id for entry in originals), default=-1) + 1
+        for repeat in range(1, scale):
+            for entry in originals:
+                new = BdmEntry(entry_id=entry.id + repeat * offsets[Hitbox])
+                new.paste(entry)
+                moveset.bdm.entries.append(new)
+
+    originals = list(moveset.bac.entries)
+    for repeat in range(1, scale):
+        repeat_offsets = {item_type: offset * repeat for item_type, offset in offsets.items()}
+        for entry in originals:
+            new = Entry(moveset.bac, len(moveset.bac.entries))
+            new.paste(entry, shifted_links(entry, repeat_offsets))
+            moveset.bac.entries.append(new)
+    return moveset
+
+
+def generate(template, template_code, dirname, code, scale, keyframes, variant=0):
+    moveset, _ = load_moveset(template, template_code)
+    if moveset is None:
+        raise SystemExit(f'Could not load template moveset {template_code} from {template}')
+    scale_moveset(moveset, scale, keyframes, variant)
+    os.makedirs(dirname, exist_ok=True)
+    save_moveset(moveset, dirname, code)
+    counts = {
+        'entries': len(moveset.bac.entries),
+        'animations': len(moveset.ean.animations) if moveset.ean is not None else 0,
+        'keyframes': sum(len(track.keyframes) for animation in moveset.ean.animations for node in animation.nodes
+                         for track in node.keyframed_animations) if moveset.ean is not None else 0,
+        'hitboxes': len(moveset.bdm.entries) if moveset.bdm is not None else 0,
+        'cameras': len(moveset.cam_ean.animations) if moveset.cam_ean is not None else 0,
+    }
+    return counts
+
+
+def file_sizes(dirname, code):
+    sizes = {}
+    for attr, filename in MOVESET_FILENAMES.items():
+        path = os.path.join(dirname, filename.format(code=code))
+        if os.path.exists(path):
+            sizes[attr] = os.path.getsize(path)
+    return sizes
+
+
+def measure(run, setup=None, repeat=3):
+    # Times run(state) repeat times, each on a fresh setup() that isn't timed. Peak memory is traced on one more
+    # run, as tracing slows everything down.
+    seconds = []
+    for _ in range(repeat + 1):
+        state = setup() if setup else None
+        if len(seconds) < repeat:
+            start = time.perf_counter()
+            run(state)
+            seconds.append(time.perf_counter() - start)
+        else:
+            tracemalloc.start()
+            run(state)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {'seconds': seconds, 'min': min(seconds), 'median': statistics.median(seconds), 'peak_memory': peak}
+
+
+def paste_entries(source, target, count):
+    # The first count source entries with sub entries over as many target entries, like pasting a selection. They
+    # are copied out of the source first the same way the GUI does, so the source stays the same between runs.
+    copied = copied_entries(source, count)
+    selected = [entry for entry in target.bac.entries if entry.sub_entries][-len(copied):]
+    return copied, selected
+
+
+def copied_entries(source, count):
+    return CopyBuffer(source, [entry for entry in source.bac.entries if entry.sub_entries][:count]).materialize()
+
+
+def load_gui(dirname, code, executor, cache=None):
+    # Same as the GUI: every file on its own worker, EANs lazily
+    loader = MovesetLoader(dirname, code, executor, cache=cache, lazy=True)
+    while not loader.done():
+        time.sleep(0.001)
+    return loader.result()
+
+
+def run_size(args, name, scale, keyframes, workdir, executor):
+    source_dir = os.path.join(workdir, name, 'source')
+    target_dir = os.path.join(workdir, name, 'target')
+    out_dir = os.path.join(workdir, name, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    generate(args.template, args.code, source_dir, SOURCE_CODE, scale, keyframes, variant=1)
+    counts = generate(args.template, args.code, target_dir, TARGET_CODE, scale, keyframes)
+    sizes = file_sizes(target_dir, TARGET_CODE)
+    total_bytes = sum(sizes.values())
+    source, _ = load_moveset(source_dir, SOURCE_CODE)
+
+    def fresh_session():
+        target, _ = load_moveset(target_dir, TARGET_CODE)
+        session = MovesetSession(target, source)
+        session.reset_target(target_dir)
+        return session
+
+    def pasted_session():
+        # A copy of the target for every run, loaded lazily like the GUI does, so every save starts from the same
+        # files and can splice the animations that didn't change
+        os.makedirs(runs_dir, exist_ok=True)
+        dirname = tempfile.mkdtemp(dir=runs_dir)
+        for filename in MOVESET_FILENAMES.values():
+            path = os.path.join(target_dir, filename.format(code=TARGET_CODE))
+            if os.path.exists(path):
+                shutil.copy2(path, dirname)
+        target, _ = load_gui(dirname, TARGET_CODE, executor)
+        session = MovesetSession(target, source)
+        session.reset_target(dirname)
+        session.paste(*paste_entries(source, session.target, MULTI_PASTE))
+        return session, dirname
+
+    def paste(count):
+        def run(session):
+            try:
+                session.paste(*paste_entries(source, session.target, count))
+            except PasteError as e:
+                raise SystemExit(f'{name}: paste failed: {e}')
+        return run
+
+    def add(session):
+        session.add(copied_entries(source, MULTI_PASTE))
+
+    def save_dirty(state):
+        session, dirname = state
+        save_moveset(session.target, dirname, TARGET_CODE, session.files_to_save(dirname, TARGET_CODE),
+                     dirty_entries=session.dirty_entries)
+
+    runs_dir = os.path.join(workdir, name, 'runs')
+    cache = FileCache(os.path.join(workdir, name, 'cache'))
+    load_gui(target_dir, TARGET_CODE, executor, cache)
+    results = {
+        'load': measure(lambda _: load_moveset(target_dir, TARGET_CODE), repeat=args.repeat),
+        'load_gui': measure(lambda _: load_gui(target_dir, TARGET_CODE, executor), repeat=args.repeat),
+        'load_gui_cached': measure(lambda _: load_gui(target_dir, TARGET_CODE, executor, cache), repeat=args.repeat),
+        'paste_single': measure(paste(1), fresh_session, args.repeat),
+        'paste_multi': measure(paste(MULTI_PASTE), fresh_session, args.repeat),
+        'add': measure(add, fresh_session, args.repeat),
+        'save': measure(lambda session: save_moveset(session.target, out_dir, TARGET_CODE), fresh_session,
+                        args.repeat),
+        # Saving over the lazily loaded files after a paste, which only writes what changed
+        'save_after_paste': measure(save_dirty, pasted_session, args.repeat),
+    }
+    shutil.rmtree(runs_dir, ignore_errors=True)
+    for key in ['load', 'load_gui', 'load_gui_cached']:
+        results[key]['bytes_per_second'] = total_bytes / results[key]['min']
+        results[key]['animations_per_second'] = counts['animations'] / results[key]['min']
+    results['save']['bytes_per_second'] = total_bytes / results['save']['min']
+    for key, count in [('paste_multi', MULTI_PASTE), ('add', MULTI_PASTE)]:
+        results[key]['entries_per_second'] = count / results[key]['min']
+    if not args.keep:
+        shutil.rmtree(os.path.join(workdir, name), ignore_errors=True)
+    return {'name': name, 'scale': scale, 'keyframe_scale': keyframes, 'counts': counts, 'file_sizes': sizes,
+            'results': results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Times loading, pasting, adding and saving on synthetic movesets scaled up from a template')
+    parser.add_argument('--template', required=True, help='Directory of the moveset to scale up')
+    parser.add_argument('--code', help='Character code of the template, if the directory has more than one')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[parse_size(size) for size in DEFAULT_SIZES],
+                        help=f'ENTRIESxKEYFRAMES scale factors (default: {" ".join(DEFAULT_SIZES)})')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the fastest counts')
+    parser.add_argument('--out', default='benchmark.json', help='JSON file to write the results to')
+    parser.add_argument('--workdir', help='Where to generate the movesets (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help="Don't delete the generated movesets")
+    args = parser.parse_args(argv)
+    args.code = detect_code(args.template, args.code, 'template')
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='yamoveset_bench_')
+    report = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'template': os.path.abspath(args.template),
+        'repeat': args.repeat,
+        'sizes': [],
+    }
+    try:
+        with ProcessPoolExecutor(max_workers=len(MOVESET_FILES)) as executor:
+            for name, scale, keyframes in args.sizes:
+                print(f'{name}...', file=sys.stderr)
+                size = run_size(args, name, scale, keyframes, workdir, executor)
+                report['sizes'].append(size)
+                print('  ' + ', '.join(f'{key} {result["min"] * 1000:.0f} ms'
+                                       for key, result in size['results'].items()), file=sys.stderr)
+    finally:
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.out}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
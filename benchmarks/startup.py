@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'YaMoveset Organizer.py')
+DEFAULT_BUDGET_MS = 500
+# Modules that must not be imported before the window shows, they are only needed once a moveset is loaded
+DEFERRED = [
+    'pyxenoverse.bac', 'pyxenoverse.bdm', 'pyxenoverse.ean', 'numpy', 'sqlite3', 'wx.lib.dialogs',
+    'yamoveset.moveset', 'yamoveset.session', 'yamoveset.library', 'yamoveset.dlg.combo', 'yamoveset.dlg.changed',
+    'yamoveset.dlg.library', 'yamoveset.dlg.performance', 'concurrent.futures.process',
+]
+
+# Runs the main script's imports without starting the app, then reports what got imported
+PROBE = '''
+import json, runpy, sys, time
+start = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name='startup')
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'deferred': [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+'''
+
+
+def parse_importtime(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package", nested ones are indented
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        modules[name] = {'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000, 'level': level}
+    return modules
+
+
+def measure():
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, MAIN, json.dumps(DEFERRED)],
+                             capture_output=True, text=True, cwd=os.path.dirname(MAIN))
+    if process.returncode:
+        raise SystemExit(f'Importing {MAIN} failed:\n{process.stderr[-2000:]}')
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['modules'] = parse_importtime(process.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures how long the GUI takes to import before its window shows')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'fail when importing takes longer than this (default: {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--repeat', type=int, default=5, help='runs to take the fastest of')
+    parser.add_argument('--top', type=int, default=15, help='number of slowest top level imports to list')
+    parser.add_argument('--out', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    runs = [measure() for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run['seconds'])
+    top_level = sorted(((name, module) for name, module in best['modules'].items() if module['level'] == 0),
+                       key=lambda item: -item[1]['cumulative_ms'])[:args.top]
+    milliseconds = best['seconds'] * 1000
+
+    print(f'Startup imports: {milliseconds:.0f} ms (budget {args.budget_ms:.0f} ms, fastest of {args.repeat})')
+    for name, module in top_level:
+        print(f'  {module["cumulative_ms"]:8.1f} ms  {name}')
+    if best['deferred']:
+        print(f'Imported at startup but should be deferred: {", ".join(best["deferred"])}')
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'milliseconds': milliseconds, 'budget_ms': args.budget_ms,
+                       'runs': [run['seconds'] * 1000 for run in runs], 'deferred': best['deferred'],
+                       'modules': best['modules']}, f, indent=2)
+    return 1 if milliseconds > args.budget_ms or best['deferred'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
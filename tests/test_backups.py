@@ -0,0 +1,125 @@
+import importlib.util
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+HAS_PYXENOVERSE = importlib.util.find_spec('pyxenoverse') is not None
+
+
+class BackupStoreTest(unittest.TestCase):
+    def setUp(self):
+        if not HAS_PYXENOVERSE:
+            self.skipTest('needs pyxenoverse')
+        from yamoveset import backups
+        self.backups = backups
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dirname = temp_dir.name
+        self.mtime = 1_600_000_000
+
+    def write(self, filename, data):
+        # Every write gets a new modification time, so a change of the same size is still noticed
+        path = os.path.join(self.dirname, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.mtime += 1
+        os.utime(path, (self.mtime, self.mtime))
+
+    def read(self, filename):
+        with open(os.path.join(self.dirname, filename), 'rb') as f:
+            return f.read()
+
+    def chunks(self, store):
+        return sorted(name for _, _, names in os.walk(os.path.join(store.path, 'chunks')) for name in names)
+
+    def test_unchanged_files_are_not_backed_up_again(self):
+        store = self.backups.BackupStore(self.dirname)
+        self.write('ABC_PLAYER.bac', b'bac')
+        first = store.backup('ABC')
+        self.assertEqual(store.backup('ABC'), first)
+        self.assertEqual(len(store.backups('ABC')), 1)
+
+    def test_identical_chunks_are_stored_once(self):
+        store = self.backups.BackupStore(self.dirname)
+        self.write('ABC_PLAYER.bac', b'same')
+        self.write('ABC_PLAYER.bdm', b'same')
+        backup = store.backup('ABC')
+        self.assertEqual(backup.files['ABC_PLAYER.bac']['chunks'], backup.files['ABC_PLAYER.bdm']['chunks'])
+        self.assertEqual(len(self.chunks(store)), 1)
+
+    def test_unchanged_file_reuses_its_chunks(self):
+        store = self.backups.BackupStore(self.dirname)
+        self.write('ABC_PLAYER.bac', b'bac')
+        self.write('ABC_PLAYER.bdm', b'bdm')
+        first = store.backup('ABC')
+        self.write('ABC_PLAYER.bdm', b'bdm 2')
+        second = store.backup('ABC')
+        self.assertNotEqual(second.id, first.id)
+        self.assertEqual(second.files['ABC_PLAYER.bac'], first.files['ABC_PLAYER.bac'])
+        self.assertEqual(len(self.chunks(store)), 3)
+
+    def test_prune_keeps_the_newest_backups(self):
+        store = self.backups.BackupStore(self.dirname, keep=2)
+        self.write('XYZ_PLAYER.bac', b'other character')
+        store.backup('XYZ')
+        for n in range(3):
+            self.write('ABC_PLAYER.bac', f'version {n}'.encode('ascii'))
+            store.backup('ABC', f'version {n}')
+        self.assertEqual([backup.note for backup in store.backups('ABC')], ['version 2', 'version 1'])
+        self.assertEqual(len(store.backups('XYZ')), 1)
+        # The chunk only the pruned backup used is gone
+        self.assertEqual(len(self.chunks(store)), 3)
+
+    def test_restore(self):
+        store = self.backups.BackupStore(self.dirname)
+        self.write('ABC_PLAYER.bac', b'old bac')
+        self.write('ABC.ean', b'old ean')
+        backup = store.backup('ABC')
+        self.write('ABC_PLAYER.bac', b'new bac')
+        self.write('ABC.cam.ean', b'new cam')
+        self.assertEqual(store.restore(backup.id), ['ABC.ean', 'ABC_PLAYER.bac'])
+        self.assertEqual(self.read('ABC_PLAYER.bac'), b'old bac')
+        self.assertEqual(self.read('ABC.ean'), b'old ean')
+        # The file added since the backup is removed, but can be restored from the backup made first
+        self.assertFalse(os.path.exists(os.path.join(self.dirname, 'ABC.cam.ean')))
+        before = store.backups('ABC')[0]
+        self.assertEqual(before.note, f'Before restoring {backup.id}')
+        store.restore(before.id)
+        self.assertEqual(self.read('ABC_PLAYER.bac'), b'new bac')
+        self.assertEqual(self.read('ABC.cam.ean'), b'new cam')
+
+    def test_damaged_backup_changes_nothing(self):
+        store = self.backups.BackupStore(self.dirname)
+        self.write('ABC_PLAYER.bac', b'old bac')
+        backup = store.backup('ABC')
+        self.write('ABC_PLAYER.bac', b'new bac')
+        self.write('ABC.cam.ean', b'new cam')
+        digest = backup.files['ABC_PLAYER.bac']['chunks'][0]
+        with open(store.chunk_path(digest), 'wb') as f:
+            f.write(b'damaged')
+        with self.assertRaises(self.backups.BackupError):
+            store.restore(backup.id)
+        self.assertEqual(self.read('ABC_PLAYER.bac'), b'new bac')
+        self.assertEqual(self.read('ABC.cam.ean'), b'new cam')
+
+    def test_backups_wait_for_each_other(self):
+        store = self.backups.BackupStore(self.dirname)
+        self.write('ABC_PLAYER.bac', b'bac')
+        other = self.backups.BackupStore(self.dirname)
+        with other.lock:
+            with mock.patch.object(self.backups, 'LOCK_TIMEOUT', 0):
+                with self.assertRaises(self.backups.BackupError):
+                    store.backup('ABC')
+            thread = threading.Thread(target=store.backup, args=('ABC',))
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(store.backups('ABC'), [])
+        thread.join()
+        self.assertEqual(len(store.backups('ABC')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+# Needs pyxenoverse and a real EAN file, e.g. YAMOVESET_TEST_EAN=path/to/ABC.ean python -m unittest discover tests
+SAMPLE = os.environ.get('YAMOVESET_TEST_EAN')
+
+
+def encode(path):
+    # The same animations always encode to the same bytes, so two files match when their re-encodings do
+    from pyxenoverse.ean import EAN
+    ean = EAN()
+    assert ean.load(path), path
+    encoded_path = path + '.encoded'
+    ean.save(encoded_path)
+    with open(encoded_path, 'rb') as f:
+        return f.read()
+
+
+@unittest.skipUnless(SAMPLE and os.path.isfile(SAMPLE), 'set YAMOVESET_TEST_EAN to an .ean file')
+class SpliceRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        from pyxenoverse.ean import EAN
+        self.dirname = tempfile.mkdtemp()
+        # Saved once by pyxenoverse, so the unchanged animations are laid out the way it encodes them
+        sample = EAN()
+        self.assertTrue(sample.load(SAMPLE))
+        self.original = os.path.join(self.dirname, 'original.ean')
+        sample.save(self.original)
+        self.ean = EAN()
+        self.assertTrue(self.ean.load(self.original))
+        if len(self.ean.animations) < 4:
+            self.skipTest('the sample needs at least 4 animations')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname, ignore_errors=True)
+
+    def assert_same_as_full_save(self, dirty):
+        from yamoveset.ean_file import splice_ean
+        spliced = os.path.join(self.dirname, 'spliced.ean')
+        full = os.path.join(self.dirname, 'full.ean')
+        self.assertTrue(splice_ean(self.ean, self.original, dirty, spliced))
+        self.ean.save(full)
+        self.assertEqual(encode(spliced), encode(full))
+
+    def replace(self, index, other):
+        # A different animation in place of index, so everything after it moves
+        animation = copy.deepcopy(self.ean.animations[other])
+        animation.name = self.ean.animations[index].name
+        self.ean.animations[index] = animation
+
+    def test_changed_first(self):
+        self.replace(0, -1)
+        self.assert_same_as_full_save({0})
+
+    def test_changed_middle(self):
+        middle = len(self.ean.animations) // 2
+        self.replace(middle, 0)
+        self.assert_same_as_full_save({middle})
+
+    def test_appended(self):
+        animation = copy.deepcopy(self.ean.animations[1])
+        animation.name += '_COPY'
+        self.ean.animations.append(animation)
+        self.assert_same_as_full_save({len(self.ean.animations) - 1})
+
+    def test_changed_last(self):
+        # The probe is then the one before the last and stays in place
+        self.replace(len(self.ean.animations) - 1, 0)
+        self.assert_same_as_full_save({len(self.ean.animations) - 1})
+
+    def test_raw_copy_of_clean_file(self):
+        from yamoveset.ean_file import splice_ean
+        spliced = os.path.join(self.dirname, 'spliced.ean')
+        self.assertTrue(splice_ean(self.ean, self.original, {1}, spliced))
+        self.assertEqual(encode(spliced), encode(self.original))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import importlib.util
+from types import SimpleNamespace
+import unittest
+
+HAS_PYXENOVERSE = importlib.util.find_spec('pyxenoverse') is not None
+
+
+class MaxMatchingTest(unittest.TestCase):
+    def setUp(self):
+        if not HAS_PYXENOVERSE:
+            self.skipTest('needs pyxenoverse')
+        from yamoveset.session import max_matching
+        self.max_matching = max_matching
+
+    def test_free_candidates(self):
+        self.assertEqual(self.max_matching(['a', 'b'], {'a': [1], 'b': [2]}), {'a': 1, 'b': 2})
+
+    def test_augmenting_path(self):
+        # a takes 1 first, b can only have 1, so a has to move over to 2
+        self.assertEqual(self.max_matching(['a', 'b'], {'a': [1, 2], 'b': [1]}), {'a': 2, 'b': 1})
+
+    def test_earlier_values_win(self):
+        self.assertEqual(self.max_matching(['a', 'b'], {'a': [1], 'b': [1]}), {'a': 1})
+
+    def test_no_candidates(self):
+        self.assertEqual(self.max_matching(['a'], {'a': []}), {})
+
+
+class Entry:
+    # Just enough of a BAC entry for the session: sub entries with items, and the static values they add up to
+    def __init__(self, index, animations):
+        from pyxenoverse.bac.sub_entry import ITEM_TYPES
+        from pyxenoverse.bac.types.animation import Animation
+        self.index = index
+        self.animations = animations
+        self.entry_pair, self.depend_value = next(
+            (entry_pair, depend_value) for entry_pair, depend_values in Animation.dependencies.items()
+            for depend_value, name in depend_values.items() if name == 'Character')
+        item_type = next(item_type for item_type, cls in ITEM_TYPES.items() if cls is Animation)
+        self.sub_entries = [SimpleNamespace(type=item_type, items=[
+            {self.entry_pair[0]: value, self.entry_pair[1]: self.depend_value} for value in animations])]
+
+    def get_static_values(self):
+        from pyxenoverse.bac.types.animation import Animation
+        return {Animation: {self.entry_pair: {self.depend_value: set(self.animations)}}}
+
+
+def moveset(code, entries, animation_count):
+    ean = SimpleNamespace(skeleton=None, animations=[
+        SimpleNamespace(name=f'{code}_{index}', frames=[code, index]) for index in range(animation_count)])
+    return SimpleNamespace(code=code, bac=SimpleNamespace(entries=entries), ean=ean, bdm=None, cam_ean=None,
+                           hashes={})
+
+
+def new_values(plan):
+    return [value for values in plan.new_indices.values() for value in values]
+
+
+class PastePlannerTest(unittest.TestCase):
+    def setUp(self):
+        if not HAS_PYXENOVERSE:
+            self.skipTest('needs pyxenoverse')
+
+    def plan(self, target_entries, source_entries, selected, copied, animation_count=4):
+        from yamoveset.session import MovesetSession
+        target = moveset('TGT', target_entries, animation_count)
+        source = moveset('SRC', source_entries, 20)
+        session = MovesetSession(target, source)
+        session.reset_target('.')
+        return session.plan_paste([source_entries[index] for index in copied],
+                                  [target_entries[index] for index in selected])
+
+    def test_free_value_of_another_entry(self):
+        # Entry 0 is not pasted over and keeps animation 0, so the value pasted into entry 2 can only go to the
+        # animation entry 3 doesn't need anymore
+        target = [Entry(200, [0]), Entry(201, [1]), Entry(202, [0]), Entry(203, [2, 3])]
+        source = [Entry(300, [10]), Entry(301, [11]), Entry(302, [12])]
+        plan = self.plan(target, source, [1, 2, 3], [0, 1, 2])
+        self.assertEqual(new_values(plan), [])
+        self.assertEqual(sorted(new_value for _, _, new_value in plan.copies), [1, 2, 3])
+
+    def test_values_used_elsewhere_are_not_taken(self):
+        target = [Entry(200, [0, 1]), Entry(201, [1])]
+        source = [Entry(300, [10])]
+        plan = self.plan(target, source, [1], [0])
+        self.assertEqual(new_values(plan), [4])
+
+
+if __name__ == '__main__':
+    unittest.main()
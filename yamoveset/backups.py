@@ -0,0 +1,289 @@
+from collections import namedtuple
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from yamoveset import perf
+from yamoveset.ean_file import read_ean_index
+from yamoveset.moveset import MOVESET_FILENAMES
+
+BACKUP_DIRNAME = '.yamoveset_backups'
+BACKUP_VERSION = 1
+# Files are cut into chunks of at most this size, EANs also at the start of every animation so an animation that
+# moved in the file still matches its chunks
+CHUNK_SIZE = 256 * 1024
+DEFAULT_KEEP = 100
+# Backups and prunes of one store wait this long for each other, a lock older than LOCK_STALE is left over from a
+# process that stopped and is taken over
+LOCK_TIMEOUT = 60
+LOCK_STALE = 600
+
+Backup = namedtuple('Backup', ['id', 'created', 'code', 'note', 'files'])
+
+
+class BackupError(Exception):
+    pass
+
+
+def moveset_filenames(code):
+    return [filename.format(code=code) for filename in MOVESET_FILENAMES.values()]
+
+
+def chunk_ranges(path, size):
+    cuts = {0, size}
+    if path.endswith('.ean'):
+        index = read_ean_index(path)
+        if index is not None:
+            cuts.update(offset for offset in index[1] if 0 < offset < size)
+    cuts = sorted(cuts)
+    for start, end in zip(cuts, cuts[1:]):
+        for chunk_start in range(start, end, CHUNK_SIZE):
+            yield chunk_start, min(chunk_start + CHUNK_SIZE, end)
+
+
+def write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class StoreLock:
+    # Keeps other processes and threads from pruning the store while a backup has written chunks but not yet its
+    # manifest, otherwise the garbage collection would remove those chunks. Can be entered again by the thread that
+    # holds it.
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def __enter__(self):
+        depth = getattr(self.local, 'depth', 0)
+        if depth == 0:
+            self.acquire()
+        self.local.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > LOCK_STALE:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise BackupError(f'{self.path} is locked by another backup')
+                time.sleep(0.05)
+            else:
+                os.write(fd, str(os.getpid()).encode('ascii'))
+                os.close(fd)
+                return
+
+
+class BackupStore:
+    # Backups of the movesets in one directory, kept in BACKUP_DIRNAME next to them. Files are stored as chunks
+    # named after their SHA-1, so every chunk is only stored once however many backups contain it. Every backup is
+    # a manifest listing the chunks of each file. A file with the same size and modification time as in the last
+    # backup isn't even read again.
+    def __init__(self, dirname, keep=DEFAULT_KEEP):
+        self.dirname = dirname
+        self.path = os.path.join(dirname, BACKUP_DIRNAME)
+        self.keep = keep
+        self.lock = StoreLock(os.path.join(self.path, 'lock'))
+
+    def chunk_path(self, digest):
+        return os.path.join(self.path, 'chunks', digest[:2], digest)
+
+    def manifest_path(self, backup_id):
+        return os.path.join(self.path, 'manifests', backup_id + '.json')
+
+    def backups(self, code=None):
+        # Newest first
+        backups = []
+        try:
+            names = os.listdir(os.path.join(self.path, 'manifests'))
+        except OSError:
+            return []
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    backup = self.get(name[:-len('.json')])
+                except BackupError:
+                    continue
+                if code is None or backup.code == code:
+                    backups.append(backup)
+        return sorted(backups, key=lambda backup: (backup.created, backup.id), reverse=True)
+
+    def get(self, backup_id):
+        try:
+            with open(self.manifest_path(backup_id), encoding='utf-8') as f:
+                manifest = json.load(f)
+            return Backup(backup_id, manifest['created'], manifest['code'], manifest.get('note', ''), manifest['files'])
+        except (OSError, ValueError, KeyError) as e:
+            raise BackupError(f'Backup {backup_id} could not be read: {e}')
+
+    @perf.timed('backup')
+    def backup(self, code, note='', filenames=None):
+        # Returns the backup of the files as they are now, which is the last one if none of them changed since
+        with self.lock:
+            return self.create_backup(code, note, filenames)
+
+    def create_backup(self, code, note, filenames):
+        if filenames is None:
+            filenames = moveset_filenames(code)
+        latest = self.backups(code)[:1]
+        previous = latest[0].files if latest else {}
+        files = {}
+        for filename in filenames:
+            path = os.path.join(self.dirname, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            known = previous.get(filename)
+            if known is not None and (known['size'], known['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                files[filename] = known
+            else:
+                files[filename] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                   'chunks': self.store_file(path, stat.st_size)}
+        if not files:
+            return None
+        if latest and files == previous:
+            return latest[0]
+
+        created = time.time()
+        backup_id = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(created))}-{code}'
+        n = 1
+        while os.path.exists(self.manifest_path(backup_id if n == 1 else f'{backup_id}-{n}')):
+            n += 1
+        if n > 1:
+            backup_id = f'{backup_id}-{n}'
+        os.makedirs(os.path.dirname(self.manifest_path(backup_id)), exist_ok=True)
+        write_atomic(self.manifest_path(backup_id), json.dumps(
+            {'version': BACKUP_VERSION, 'created': created, 'code': code, 'note': note, 'files': files},
+            indent=1).encode('utf-8'))
+        self.prune()
+        return Backup(backup_id, created, code, note, files)
+
+    def store_file(self, path, size):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) != size:
+            raise BackupError(f'{os.path.basename(path)} changed while it was backed up')
+        digests = []
+        for start, end in chunk_ranges(path, size):
+            chunk = data[start:end]
+            digest = hashlib.sha1(chunk).hexdigest()
+            chunk_path = self.chunk_path(digest)
+            if not os.path.exists(chunk_path):
+                os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                write_atomic(chunk_path, chunk)
+                perf.count('backup_chunks_written')
+            digests.append(digest)
+        return digests
+
+    def read_file(self, filename, info):
+        data = bytearray()
+        for digest in info['chunks']:
+            try:
+                with open(self.chunk_path(digest), 'rb') as f:
+                    chunk = f.read()
+            except OSError:
+                raise BackupError(f'The backup of {filename} is missing a chunk')
+            if hashlib.sha1(chunk).hexdigest() != digest:
+                raise BackupError(f'The backup of {filename} is damaged')
+            data += chunk
+        if len(data) != info['size']:
+            raise BackupError(f'The backup of {filename} is damaged')
+        return data
+
+    @perf.timed('restore')
+    def restore(self, backup_id):
+        # The files as they are now are backed up first, so a restore can be undone by restoring that. Every file is
+        # put together and checked before any of them is replaced. Moveset files that weren't there when the backup
+        # was made are removed. Returns the restored file names.
+        with self.lock:
+            backup = self.get(backup_id)
+            self.backup(backup.code, f'Before restoring {backup_id}')
+            self.write_files(backup)
+            for filename in moveset_filenames(backup.code):
+                if filename not in backup.files:
+                    try:
+                        os.remove(os.path.join(self.dirname, filename))
+                    except FileNotFoundError:
+                        pass
+        return sorted(backup.files)
+
+    def write_files(self, backup):
+        paths = {filename: os.path.join(self.dirname, filename) for filename in backup.files}
+        written = []
+        try:
+            for filename, info in backup.files.items():
+                data = self.read_file(filename, info)
+                written.append(filename)
+                with open(paths[filename] + '.tmp', 'wb') as f:
+                    f.write(data)
+            for filename in written:
+                os.replace(paths[filename] + '.tmp', paths[filename])
+        finally:
+            for filename in written:
+                if os.path.exists(paths[filename] + '.tmp'):
+                    os.remove(paths[filename] + '.tmp')
+
+    def prune(self):
+        # Only the newest backups per character are kept, chunks no other backup uses go with them
+        with self.lock:
+            removed = False
+            by_code = {}
+            for backup in self.backups():
+                by_code.setdefault(backup.code, []).append(backup)
+            for backups in by_code.values():
+                for backup in backups[self.keep:]:
+                    os.remove(self.manifest_path(backup.id))
+                    removed = True
+            if removed:
+                self.collect_garbage()
+
+    def collect_garbage(self):
+        with self.lock:
+            used = {digest for backup in self.backups() for info in backup.files.values()
+                    for digest in info['chunks']}
+            chunks_dir = os.path.join(self.path, 'chunks')
+            for dirpath, _, names in os.walk(chunks_dir):
+                for name in names:
+                    if name not in used:
+                        try:
+                            os.remove(os.path.join(dirpath, name))
+                        except OSError:
+                            pass
+
+    def size(self):
+        total = 0
+        for dirpath, _, names in os.walk(self.path):
+            total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in names)
+        return total
+
+
+# Called by save_moveset before it replaces the files of code in dirname
+def backup_moveset(dirname, code):
+    return BackupStore(dirname).backup(code, 'Before saving')
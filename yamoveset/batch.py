@@ -0,0 +1,187 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import traceback
+
+from yamoveset.backups import backup_moveset
+from yamoveset.clipboard import CopyBuffer
+from yamoveset.moveset import find_character_codes, load_moveset, save_moveset
+from yamoveset.report import report_rows
+from yamoveset.session import MovesetSession, PasteError
+
+
+class BatchError(Exception):
+    pass
+
+
+def empty_manifest():
+    return {'source': None, 'source_code': None, 'paste': [], 'add': [], 'compact': False, 'targets': []}
+
+
+def duplicate_targets(paste):
+    seen, duplicates = set(), set()
+    for _, target in paste:
+        (duplicates if target in seen else seen).add(target)
+    return sorted(duplicates)
+
+
+# "paste" is a list of [source, target] pairs, or an object mapping source to target entries, which can't paste
+# one source entry over several target entries
+def read_paste(paste, path):
+    if isinstance(paste, dict):
+        paste = list(paste.items())
+    elif not isinstance(paste, list) or not all(isinstance(pair, list) and len(pair) == 2 for pair in paste):
+        raise BatchError(f'Invalid paste/add index in {path}: "paste" must be a list of [source, target] entry pairs')
+    try:
+        paste = [(int(source), int(target)) for source, target in paste]
+    except (TypeError, ValueError) as e:
+        raise BatchError(f'Invalid paste/add index in {path}: {e}')
+    duplicates = duplicate_targets(paste)
+    if duplicates:
+        raise BatchError(f'Invalid paste/add index in {path}: target entry(s) '
+                         f'{", ".join(map(str, duplicates))} are pasted over more than once')
+    return paste
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BatchError(f'Could not read manifest {path}: {e}')
+    if not isinstance(manifest, dict):
+        raise BatchError(f'Invalid manifest {path}: expected a JSON object')
+    paste, add = read_paste(manifest.get('paste', []), path), manifest.get('add', [])
+    if not isinstance(add, list):
+        raise BatchError(f'Invalid paste/add index in {path}: "add" must be a list of source entries')
+    try:
+        add = [int(index) for index in add]
+    except (TypeError, ValueError) as e:
+        raise BatchError(f'Invalid paste/add index in {path}: {e}')
+
+    targets = []
+    for target in manifest.get('targets', []):
+        if isinstance(target, str):
+            target = {'target': target}
+        if not isinstance(target, dict) or not isinstance(target.get('target'), str):
+            raise BatchError(f'Invalid target in {path}: {target!r}')
+        targets.append(target)
+    return {
+        'source': manifest.get('source'),
+        'source_code': manifest.get('source_code'),
+        'paste': paste,
+        'add': add,
+        'compact': bool(manifest.get('compact', False)),
+        'targets': targets,
+    }
+
+
+def detect_code(dirname, code, what):
+    if code:
+        return code
+    character_codes = find_character_codes(dirname)
+    if not character_codes:
+        raise BatchError(f'No *_PLAYER.bac found in {what} directory {dirname}')
+    if len(character_codes) > 1:
+        raise BatchError(f'Found multiple characters in {what} directory {dirname} '
+                         f'({", ".join(character_codes)}), pick one with --{what}-code')
+    return character_codes[0]
+
+
+def open_moveset(dirname, code, what, cache=None):
+    code = detect_code(dirname, code, what)
+    moveset, warnings = load_moveset(dirname, code, cache)
+    for warning in warnings:
+        print(f'{code}: {warning}', file=sys.stderr)
+    if moveset is None:
+        raise BatchError(f'Could not load {what} moveset {code} from {dirname}')
+    return moveset
+
+
+def entries_by_index(moveset, indices, what):
+    entries = {entry.index: entry for entry in moveset.bac.entries}
+    missing = [index for index in indices if index not in entries]
+    if missing:
+        raise BatchError(f'{moveset.code}_PLAYER.bac ({what}) does not contain entry(s) '
+                         f'{", ".join(str(index) for index in missing)}')
+    return [entries[index] for index in indices]
+
+
+# Copies of the source entries to paste, like the GUI pastes them. The source is shared by every target a worker
+# runs, so it must not end up sharing entries with or being changed by one of them.
+def copy_entries(source, indices):
+    return CopyBuffer(source, entries_by_index(source, indices, 'source')).materialize()
+
+
+# Pastes/adds entries from source into target following the manifest. Returns the report rows.
+def apply_manifest(session, manifest):
+    changed_values = {}
+    target, source = session.target, session.source
+    if manifest['paste']:
+        copied = copy_entries(source, [index for index, _ in manifest['paste']])
+        selected = entries_by_index(target, [index for _, index in manifest['paste']], 'target')
+        result = session.paste(copied, selected)
+        changed_values = result.changed_values
+    rows = report_rows(changed_values, target.code, source.code)
+    if manifest['add']:
+        copied = copy_entries(source, manifest['add'])
+        result = session.add(copied)
+        rows += report_rows(result.changed_values, target.code, source.code)
+    if manifest['compact']:
+        session.compact()
+    return rows
+
+
+# Loads, pastes into and saves one target moveset. Returns the names of the saved files, the save code and the rows.
+def paste_target(source, manifest, target_dir, target_code=None, out=None, code=None, cache=None):
+    target = open_moveset(target_dir, target_code, 'target', cache)
+    session = MovesetSession(target, source)
+    session.reset_target(target_dir)
+    rows = apply_manifest(session, manifest)
+
+    out = out or target_dir
+    code = code or target.code
+    os.makedirs(out, exist_ok=True)
+    # Like the GUI, whatever gets overwritten is backed up first
+    saved = save_moveset(target, out, code, session.files_to_save(out, code), backup_moveset)
+    return saved, code, rows
+
+
+# The source moveset is sent to every worker once when it starts, instead of with every target
+worker_source = None
+worker_cache = None
+
+
+def init_worker(source, cache=None):
+    global worker_source, worker_cache
+    worker_source = source
+    worker_cache = cache
+
+
+def run_target(manifest, target):
+    report = {'target': target['target'], 'ok': False, 'error': None, 'saved': [], 'changed': []}
+    try:
+        saved, code, rows = paste_target(
+            worker_source, manifest, target['target'], target.get('target_code'), target.get('out'),
+            target.get('code'), worker_cache)
+    except (BatchError, PasteError) as e:
+        report['error'] = str(e)
+    except Exception:
+        report['error'] = traceback.format_exc()
+    else:
+        report.update(ok=True, code=code, saved=saved, changed=rows)
+    return report
+
+
+# Runs one paste manifest against many targets, one target per worker process at a time
+def run_batch(source, manifest, targets, max_workers=None, callback=None, cache=None):
+    reports = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(source, cache)) as executor:
+        futures = [executor.submit(run_target, manifest, target) for target in targets]
+        for future in futures:
+            report = future.result()
+            if callback:
+                callback(report)
+            reports.append(report)
+    return reports
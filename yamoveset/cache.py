@@ -0,0 +1,85 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pyxenoverse
+
+# Bump when the cached form changes, old entries just stop matching and get evicted
+CACHE_VERSION = 2
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+
+def default_cache_dir():
+    if os.environ.get('YAMOVESET_CACHE'):
+        return os.environ['YAMOVESET_CACHE']
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'YaMoveset', 'cache')
+
+
+class FileCache:
+    # Pickled results of parsing a file, keyed by its path, size and modification time.
+    # Only holds a directory name, so it can be sent to the loader worker processes.
+    def __init__(self, dirname=None, max_size=DEFAULT_MAX_SIZE):
+        self.dirname = dirname or default_cache_dir()
+        self.max_size = max_size
+
+    def cache_path(self, path, obj_class):
+        stat = os.stat(path)
+        key = '|'.join(str(part) for part in [
+            CACHE_VERSION, getattr(pyxenoverse, '__version__', ''), f'{obj_class.__module__}.{obj_class.__name__}',
+            os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns])
+        return os.path.join(self.dirname, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle')
+
+    def get(self, path, obj_class):
+        try:
+            cache_path = self.cache_path(path, obj_class)
+            with open(cache_path, 'rb') as f:
+                value = pickle.load(f)
+            # The modification time is what the LRU eviction goes by
+            os.utime(cache_path)
+            return value
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+    def put(self, path, obj_class, value):
+        try:
+            os.makedirs(self.dirname, exist_ok=True)
+            cache_path = self.cache_path(path, obj_class)
+            fd, temp_path = tempfile.mkstemp(dir=self.dirname, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, cache_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        try:
+            with os.scandir(self.dirname) as it:
+                for entry in it:
+                    if entry.name.endswith('.pickle'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another loader may have evicted it already
+                pass
+            total -= size
+
+    def clear(self):
+        max_size, self.max_size = self.max_size, 0
+        self.evict()
+        self.max_size = max_size
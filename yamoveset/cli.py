@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from yamoveset import perf
+from yamoveset.backups import BackupError, BackupStore
+from yamoveset.batch import (BatchError, duplicate_targets, empty_manifest, load_manifest, open_moveset, paste_target,
+                             run_batch)
+from yamoveset.cache import FileCache
+from yamoveset.library import Library
+from yamoveset.moveset import MOVESET_FILENAMES
+from yamoveset.report import write_report
+from yamoveset.session import PasteError
+
+
+class CliError(BatchError):
+    pass
+
+
+def parse_map(text):
+    # "300:300,301:305" -> [(300, 300), (301, 305)], source entry first
+    pairs = []
+    for pair in text.split(','):
+        pair = pair.strip()
+        if not pair:
+            continue
+        try:
+            source, target = pair.split(':')
+            pairs.append((int(source), int(target)))
+        except ValueError:
+            raise CliError(f'Invalid mapping "{pair}", expected SOURCE:TARGET')
+    check_targets(pairs)
+    return pairs
+
+
+def check_targets(pairs):
+    duplicates = duplicate_targets(pairs)
+    if duplicates:
+        raise CliError(f'Target entry(s) {", ".join(map(str, duplicates))} are pasted over more than once')
+
+
+def parse_entries(text):
+    try:
+        return [int(index) for index in text.split(',') if index.strip()]
+    except ValueError:
+        raise CliError(f'Invalid entry list "{text}"')
+
+
+def check_code(code):
+    if code is not None and (len(code) != 3 or not code.isalnum()):
+        raise CliError('Character code can only consist of 3 alphanumeric values')
+
+
+def open_cache(args):
+    return None if args.no_cache else FileCache(args.cache_dir)
+
+
+def read_manifest(args):
+    manifest = load_manifest(args.manifest) if args.manifest else empty_manifest()
+    if args.map:
+        manifest['paste'] += parse_map(args.map)
+        check_targets(manifest['paste'])
+    if args.add:
+        manifest['add'] += parse_entries(args.add)
+    if args.compact:
+        manifest['compact'] = True
+    source_dir = args.source or manifest['source']
+    if not source_dir:
+        raise CliError('No source moveset given, use --source or "source" in the manifest')
+    if not manifest['paste'] and not manifest['add']:
+        raise CliError('Nothing to do, use --map, --add or a manifest')
+    return manifest, open_moveset(source_dir, args.source_code or manifest['source_code'], 'source', open_cache(args))
+
+
+def paste_command(args):
+    check_code(args.code)
+    manifest, source = read_manifest(args)
+    saved, code, rows = paste_target(
+        source, manifest, args.target, args.target_code, args.out, args.code, open_cache(args))
+    if args.report:
+        write_report(args.report, rows)
+    print(f'Pasted {len(manifest["paste"])} and added {len(manifest["add"])} entry(s) from {source.code} '
+          f'into {code}, wrote {", ".join(saved) or "nothing"}')
+
+
+def batch_command(args):
+    manifest, source = read_manifest(args)
+    targets = manifest['targets'] + [{'target': target} for target in args.target]
+    if not targets:
+        raise CliError('No target movesets given, use --target or "targets" in the manifest')
+    if args.out_root:
+        for target in targets:
+            target.setdefault('out', os.path.join(args.out_root, os.path.basename(os.path.normpath(target['target']))))
+    for target in targets:
+        check_code(target.get('code'))
+
+    def print_report(report):
+        if report['ok']:
+            print(f'{report["target"]}: wrote {", ".join(report["saved"]) or "nothing"}')
+        else:
+            print(f'{report["target"]}: Error: {report["error"]}', file=sys.stderr)
+
+    reports = run_batch(source, manifest, targets, args.jobs, print_report, open_cache(args))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+    failed = sum(not report['ok'] for report in reports)
+    print(f'{len(reports) - failed}/{len(reports)} target(s) done')
+    if failed:
+        raise CliError(f'{failed} target(s) failed')
+
+
+def index_command(args):
+    library = Library(args.library)
+    try:
+        indexed, removed = library.update(
+            args.root, args.jobs, lambda done, total: print(f'Indexed {done}/{total}', end='\r'), open_cache(args))
+        print(f'Indexed {indexed} and removed {removed} moveset(s), {library.count()} in {library.path}')
+    finally:
+        library.close()
+
+
+def query_command(args):
+    library = Library(args.library)
+    try:
+        if args.identical:
+            try:
+                code, entry_index = args.identical.split(':')
+                entry_index = int(entry_index)
+            except ValueError:
+                raise CliError(f'Invalid entry "{args.identical}", expected CODE:ENTRY')
+            results = library.find_identical(code, entry_index, args.dirname)
+        else:
+            results = library.find_animations(args.name)
+    finally:
+        library.close()
+    for code, dirname, file, animation_index, name, entries in results:
+        filename = MOVESET_FILENAMES[file].format(code=code)
+        print(f'{filename} {animation_index} {name}, used by entry(s) {", ".join(map(str, entries)) or "none"} '
+              f'in {dirname}')
+    print(f'{len(results)} animation(s) found')
+
+
+def backups_command(args):
+    store = BackupStore(args.dirname)
+    backups = store.backups(args.code)
+    for backup in backups:
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(backup.created))
+        size = sum(info['size'] for info in backup.files.values())
+        print(f'{backup.id}  {created}  {backup.note or "-"}  {", ".join(sorted(backup.files))} '
+              f'({size / 1024 ** 2:.1f} MB)')
+    print(f'{len(backups)} backup(s), {store.size() / 1024 ** 2:.1f} MB in {store.path}')
+
+
+def restore_command(args):
+    restored = BackupStore(args.dirname).restore(args.backup)
+    print(f'Restored {", ".join(restored)} from {args.backup}')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='yamoveset', description='YaMoveset Organizer batch mode')
+    parser.add_argument('--cache-dir', help='where to keep parsed files between runs (default: the GUI cache)')
+    parser.add_argument('--no-cache', action='store_true', help='always parse the files, without the cache')
+    parser.add_argument('--profile', metavar='DIR', help='write a cProfile and JSON trace of the command to DIR')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    paste = subparsers.add_parser('paste', help='paste/add BAC entries from a source moveset into a target moveset')
+    paste.add_argument('--target', required=True, help='directory of the moveset to paste into')
+    paste.add_argument('--target-code', help='character code of the target, if the directory has several')
+    paste.add_argument('--source', help='directory of the moveset to copy from')
+    paste.add_argument('--source-code', help='character code of the source, if the directory has several')
+    paste.add_argument('--map', help='entries to paste over, as SOURCE:TARGET pairs, e.g. 300:300,301:305')
+    paste.add_argument('--add', help='source entries to add at the end of the target, e.g. 400,401')
+    paste.add_argument('--manifest', help='JSON file with "source", "source_code", "paste", "add" and "compact"')
+    paste.add_argument('--compact', action='store_true', help='remove unused animations and hitboxes afterwards')
+    paste.add_argument('--out', help='directory to save to (default: the target directory)')
+    paste.add_argument('--code', help='3-character code to save as (default: the target code)')
+    paste.add_argument('--report', help='write the changed values to this .csv or .json file')
+    paste.set_defaults(func=paste_command)
+
+    batch = subparsers.add_parser(
+        'batch', help='run the same paste manifest against many target movesets, in parallel')
+    batch.add_argument('--manifest', help='JSON paste manifest, its "targets" list is used next to --target')
+    batch.add_argument('--target', action='append', default=[], help='target moveset directory, can be repeated')
+    batch.add_argument('--source', help='directory of the moveset to copy from')
+    batch.add_argument('--source-code', help='character code of the source, if the directory has several')
+    batch.add_argument('--map', help='entries to paste over, as SOURCE:TARGET pairs, e.g. 300:300,301:305')
+    batch.add_argument('--add', help='source entries to add at the end of the targets, e.g. 400,401')
+    batch.add_argument('--compact', action='store_true', help='remove unused animations and hitboxes afterwards')
+    batch.add_argument('--out-root', help='save each target to OUT_ROOT/<target directory name> instead of in place')
+    batch.add_argument('--jobs', type=int, help='number of worker processes (default: one per core)')
+    batch.add_argument('--report', help='write the per-target results to this .json file')
+    batch.set_defaults(func=batch_command)
+
+    index = subparsers.add_parser('index', help='index every moveset below a directory for searching')
+    index.add_argument('root', help='directory to search for *_PLAYER.bac files')
+    index.add_argument('--library', help='index file to update (default: the one the GUI uses)')
+    index.add_argument('--jobs', type=int, help='number of worker processes (default: one per core)')
+    index.set_defaults(func=index_command)
+
+    query = subparsers.add_parser('query', help='search the moveset index')
+    query.add_argument('--library', help='index file to search (default: the one the GUI uses)')
+    what = query.add_mutually_exclusive_group(required=True)
+    what.add_argument('--name', help='animations with a name containing this, or matching it with * wildcards')
+    what.add_argument('--identical', help='animations identical to the ones a BAC entry uses, as CODE:ENTRY')
+    query.add_argument('--dirname', help='directory of the CODE moveset, if the index has several')
+    query.set_defaults(func=query_command)
+
+    backups = subparsers.add_parser('backups', help='list the backups made when saving to a directory')
+    backups.add_argument('dirname', help='directory of the movesets')
+    backups.add_argument('--code', help='only list the backups of this character code')
+    backups.set_defaults(func=backups_command)
+
+    restore = subparsers.add_parser('restore', help='put the moveset files of a backup back')
+    restore.add_argument('dirname', help='directory of the movesets')
+    restore.add_argument('backup', help='backup to restore, as listed by the backups command')
+    restore.set_defaults(func=restore_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        perf.recorder.enable_profiling(args.profile)
+    try:
+        with perf.operation(args.command):
+            args.func(args)
+    except (BatchError, BackupError, PasteError) as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    return 0
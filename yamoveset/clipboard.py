@@ -0,0 +1,45 @@
+import copy
+
+
+class CopyBuffer:
+    # Holds references to the copied source entries instead of a pickled copy of them. The source files are never
+    # modified, so the references are a stable snapshot until the source is reloaded.
+    def __init__(self, source, entries):
+        self.code = source.code
+        self.files = [obj for obj in (source.bac, source.bdm, source.ean, source.cam_ean) if obj is not None]
+        self.entries = list(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def indices(self):
+        return [entry.index for entry in self.entries]
+
+    def materialize(self):
+        # Copy on write: only the items a paste remaps the character values of are copied, along with the sub
+        # entries and entries holding them. Everything else stays shared with the source, which is never modified.
+        from pyxenoverse.bac.sub_entry import ITEM_TYPES
+        from yamoveset.session import PASTE_TYPES
+
+        memo = {id(obj): obj for obj in self.files}
+        entries = []
+        for entry in self.entries:
+            entry = copy.copy(entry)
+            sub_entries = []
+            for sub_entry in entry.sub_entries:
+                item_type = ITEM_TYPES[sub_entry.type]
+                if item_type in PASTE_TYPES and any(remapped(item, item_type) for item in sub_entry.items):
+                    sub_entry = copy.copy(sub_entry)
+                    sub_entry.items = [copy.deepcopy(item, memo) if remapped(item, item_type) else item
+                                       for item in sub_entry.items]
+                sub_entries.append(sub_entry)
+            entry.sub_entries = sub_entries
+            entries.append(entry)
+        return entries
+
+
+def remapped(item, item_type):
+    # Whether a paste links any value of the item to the target moveset
+    return any(depend_values.get(item[entry_pair[1]]) == 'Character'
+               for entry_pair, depend_values in item_type.dependencies.items())
@@ -0,0 +1,43 @@
+from pyxenoverse.bac.sub_entry import ITEM_TYPES
+from pyxenoverse.bac.types.hitbox import Hitbox
+
+
+def character_references(bac, item_type):
+    # Yields every item value that points into the character's own EAN/BDM/CAM.EAN
+    for entry in bac.entries:
+        for sub_entry in entry.sub_entries:
+            if ITEM_TYPES[sub_entry.type] != item_type:
+                continue
+            for entry_pair, depends in item_type.dependencies.items():
+                for item in sub_entry.items:
+                    if depends.get(item[entry_pair[1]]) == 'Character':
+                        yield entry, item, entry_pair[0]
+
+
+# Drops every animation no BAC item uses and renumbers the rest in one pass.
+# Returns the old indices of the kept animations in their new order, and the indices of the changed BAC entries.
+def compact_animations(bac, ean, item_type):
+    references = list(character_references(bac, item_type))
+    count = len(ean.animations)
+    live = sorted({item[key] for _, item, key in references if 0 <= item[key] < count})
+    if len(live) == count:
+        return live, set()
+
+    remap = {old: new for new, old in enumerate(live)}
+    ean.animations[:] = [ean.animations[old] for old in live]
+    changed_entries = set()
+    for entry, item, key in references:
+        value = item[key]
+        if value in remap and remap[value] != value:
+            item[key] = remap[value]
+            changed_entries.add(entry.index)
+    return live, changed_entries
+
+
+# BDM entries carry their own id, so unused ones can be dropped without touching the BAC
+def compact_bdm(bac, bdm):
+    live = {item[key] for _, item, key in character_references(bac, Hitbox)}
+    removed = [entry.id for entry in bdm.entries if entry.id not in live]
+    if removed:
+        bdm.entries[:] = [entry for entry in bdm.entries if entry.id in live]
+    return removed
@@ -1,55 +1,118 @@
+import os
+
 import wx
-from wx.lib.scrolledpanel import ScrolledPanel
-from pyxenoverse.bac.types.animation import Animation
-from pyxenoverse.bac.types.camera import Camera
-from pyxenoverse.bac.types.hitbox import Hitbox
+from pubsub import pub
+
+from yamoveset import perf
+from yamoveset.moveset import MOVESET_FILENAMES
+from yamoveset.report import report_rows, similar_values, write_report
+from yamoveset.session import ITEM_FILES, PASTE_TYPES
+
+COLUMNS = ['File', 'BAC Entry', 'New', '', 'Old', 'Status', 'Similar']
+SORT_KEYS = [
+    lambda value: PASTE_TYPES.index(value.item_type),
+    lambda value: value.entry_index,
+    lambda value: value.new_value,
+    None,
+    lambda value: value.old_value,
+    lambda value: value.status,
+    None,
+]
+
+
+class ChangedListCtrl(wx.ListCtrl):
+    # Virtual list, rows are only formatted when they are drawn
+    def __init__(self, parent, values, target_code, suggestions):
+        super().__init__(parent, size=(700, 500), style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_HRULES)
+        self.values = values
+        self.suggestions = suggestions
+        self.filenames = {item_type: MOVESET_FILENAMES[ITEM_FILES[item_type]].format(code=target_code)
+                          for item_type in PASTE_TYPES}
+        for col, (label, width) in enumerate(zip(COLUMNS, [100, 80, 170, 30, 170, 80, 100])):
+            self.InsertColumn(col, label, width=width)
+        self.sort_column = None
+        self.sort_reverse = False
+        self.Bind(wx.EVT_LIST_COL_CLICK, self.on_col_click)
+        self.SetItemCount(len(values))
+
+    def OnGetItemText(self, item, col):
+        value = self.values[item]
+        if col == 0:
+            return self.filenames[value.item_type]
+        elif col == 1:
+            return value.entry_string
+        elif col == 2:
+            return value.new_string
+        elif col == 3:
+            return '<-'
+        elif col == 4:
+            return value.old_string
+        elif col == 5:
+            return value.status
+        return similar_values(self.suggestions, value)
+
+    def on_col_click(self, event):
+        col = event.GetColumn()
+        if SORT_KEYS[col] is None:
+            return
+        self.sort_reverse = not self.sort_reverse if col == self.sort_column else False
+        self.sort_column = col
+        self.values.sort(key=SORT_KEYS[col], reverse=self.sort_reverse)
+        self.Refresh()
 
 
 class ChangedDialog(wx.Dialog):
-    def __init__(self, parent, changed_values, *args, **kw):
-        super().__init__(parent, *args, **kw)
-        self.SetTitle("Combo info")
+    # suggest() returns the similar animations for the Similar column, it is only called once the dialog shows
+    def __init__(self, parent, changed_values, suggest=None, *args, **kw):
+        super().__init__(parent, *args, **kw, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.SetTitle("Changed values")
+        self.changed_values = changed_values
+        self.target_code = parent.code
+        self.source_code = parent.parent.side_panel.code
         sizer = wx.BoxSizer(wx.VERTICAL)
-        font = wx.Font(10, wx.DEFAULT, wx.NORMAL, wx.BOLD)
-        scrolled_panel = ScrolledPanel(self, size=(400, 600))
-        panel_sizer = wx.BoxSizer(wx.VERTICAL)
-        for item_type, values in changed_values.items():
-            label = wx.StaticText(scrolled_panel, -1, item_type.__name__)
-            label.SetFont(font)
-            panel_sizer.AddSpacer(10)
-            panel_sizer.Add(label, 0, wx.CENTER)
-            panel_sizer.AddSpacer(10)
-
-            grid_sizer = wx.FlexGridSizer(rows=len(values) + 1, cols=4, hgap=10, vgap=10)
-            grid_sizer.Add(wx.StaticText(scrolled_panel, -1, 'BAC Entry'))
-            if item_type == Animation:
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, f'{parent.code}.ean'))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, ''))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, f'{parent.parent.side_panel.code}.ean'))
-            elif item_type == Hitbox:
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, f'{parent.code}_PLAYER.bdm'))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, ''))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, f'{parent.parent.side_panel.code}_PLAYER.bdm'))
-            elif item_type == Camera:
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, f'{parent.code}.cam.ean'))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, ''))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, f'{parent.parent.side_panel.code}.cam.ean'))
-            else:
-                raise(TypeError(f'Unsupported type: {item_type.__name__}'))
-            for val in values:
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, val[0]))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, val[1]))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, '<-'))
-                grid_sizer.Add(wx.StaticText(scrolled_panel, -1, val[2]))
-            panel_sizer.Add(grid_sizer, 0, wx.ALL, 10)
-        scrolled_panel.SetSizer(panel_sizer)
-        scrolled_panel.SetupScrolling()
-
-        sizer.Add(scrolled_panel, 0, wx.ALL | wx.EXPAND, 10)
-        sizer.Add(self.CreateButtonSizer(wx.OK), 0, wx.CENTER | wx.ALL, 10)
+
+        values = [value for item_type in PASTE_TYPES for value in changed_values.get(item_type, [])]
+        self.list_ctrl = ChangedListCtrl(self, values, self.target_code, {})
+        sizer.Add(self.list_ctrl, 1, wx.ALL | wx.EXPAND, 10)
+
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        export = wx.Button(self, wx.ID_SAVEAS, "Export...")
+        export.Bind(wx.EVT_BUTTON, self.on_export)
+        button_sizer.Add(export)
+        button_sizer.AddSpacer(10)
+        button_sizer.Add(self.CreateButtonSizer(wx.OK))
+        sizer.Add(button_sizer, 0, wx.CENTER | wx.ALL, 10)
 
         self.SetSizer(sizer)
         sizer.Fit(self)
 
         self.CenterOnParent()
         self.Layout()
+        if suggest is not None:
+            wx.CallAfter(self.add_suggestions, suggest)
+
+    def add_suggestions(self, suggest):
+        # The paste is done by now, so whatever goes wrong here only leaves the Similar column empty
+        if not self:
+            return
+        try:
+            with perf.operation('Similar animations'):
+                suggestions = suggest()
+        except Exception as e:
+            pub.sendMessage('set_status_bar', text=f'Looking for similar animations failed: {e}')
+            return
+        if self:
+            self.list_ctrl.suggestions = suggestions
+            self.list_ctrl.Refresh()
+
+    def on_export(self, _):
+        with wx.FileDialog(self, 'Export paste report', wildcard='CSV files (*.csv)|*.csv|JSON files (*.json)|*.json',
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            path = dlg.GetPath()
+            extension = ['.csv', '.json'][dlg.GetFilterIndex()]
+        if not os.path.splitext(path)[1]:
+            path += extension
+        write_report(path, report_rows(
+            self.changed_values, self.target_code, self.source_code, self.list_ctrl.suggestions))
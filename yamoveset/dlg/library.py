@@ -0,0 +1,113 @@
+import re
+import threading
+
+import wx
+
+from yamoveset.library import Library
+from yamoveset.moveset import MOVESET_FILENAMES
+
+COLUMNS = [('Character', 70), ('File', 110), ('Index', 50), ('Name', 200), ('Used by', 150), ('Directory', 300)]
+
+
+class LibraryListCtrl(wx.ListCtrl):
+    def __init__(self, parent):
+        super().__init__(parent, size=(880, 400), style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_HRULES | wx.LC_SINGLE_SEL)
+        self.results = []
+        for col, (label, width) in enumerate(COLUMNS):
+            self.InsertColumn(col, label, width=width)
+
+    def set_results(self, results):
+        self.results = results
+        self.SetItemCount(len(results))
+        self.Refresh()
+
+    def OnGetItemText(self, item, col):
+        code, dirname, file, animation_index, name, entries = self.results[item]
+        return [code, MOVESET_FILENAMES[file].format(code=code), str(animation_index), name,
+                ', '.join(map(str, entries)), dirname][col]
+
+
+class LibraryDialog(wx.Dialog):
+    def __init__(self, parent, *args, **kw):
+        super().__init__(parent, *args, **kw, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.SetTitle("Search movesets")
+        self.parent = parent
+        self.library = Library()
+        self.indexing = False
+        sizer = wx.BoxSizer(wx.VERTICAL)
+
+        search_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.search = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.search.SetDescriptiveText('Animation name, or CODE:ENTRY for animations identical to that entry')
+        self.search.Bind(wx.EVT_TEXT_ENTER, self.on_search)
+        self.search.Bind(wx.EVT_SEARCHCTRL_SEARCH_BTN, self.on_search)
+        search_sizer.Add(self.search, 1, wx.EXPAND)
+        search_sizer.AddSpacer(10)
+        self.index_button = wx.Button(self, wx.ID_ANY, "Index Folder...")
+        self.index_button.Bind(wx.EVT_BUTTON, self.on_index)
+        search_sizer.Add(self.index_button)
+        sizer.Add(search_sizer, 0, wx.ALL | wx.EXPAND, 10)
+
+        self.list_ctrl = LibraryListCtrl(self)
+        self.list_ctrl.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activate)
+        sizer.Add(self.list_ctrl, 1, wx.LEFT | wx.RIGHT | wx.EXPAND, 10)
+        self.status = wx.StaticText(self, label=f'{self.library.count()} moveset(s) indexed. '
+                                                f'Double click a result to open it on the right')
+        sizer.Add(self.status, 0, wx.ALL | wx.EXPAND, 10)
+        sizer.Add(self.CreateButtonSizer(wx.CLOSE), 0, wx.CENTER | wx.BOTTOM, 10)
+        self.Bind(wx.EVT_BUTTON, lambda _: self.Hide(), id=wx.ID_CLOSE)
+
+        self.SetSizer(sizer)
+        sizer.Fit(self)
+        self.CenterOnParent()
+        self.Layout()
+
+    def on_search(self, _):
+        text = self.search.GetValue().strip()
+        if not text:
+            return
+        match = re.fullmatch(r'(\w{3}):(\d+)', text)
+        if match:
+            results = self.library.find_identical(match[1], int(match[2]))
+        else:
+            results = self.library.find_animations(text)
+        self.list_ctrl.set_results(results)
+        self.status.SetLabel(f'{len(results)} animation(s) found')
+
+    def on_activate(self, event):
+        code, dirname, _, _, _, _ = self.list_ctrl.results[event.GetIndex()]
+        panel = self.parent.side_panel
+        panel.dirname = dirname
+        self.parent.load_files(dirname, code, panel)
+
+    def on_index(self, _):
+        if self.indexing:
+            return
+        with wx.DirDialog(self, 'Choose directory to index movesets in',
+                          style=wx.DD_DEFAULT_STYLE | wx.DD_DIR_MUST_EXIST) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            root = dlg.GetPath()
+        self.indexing = True
+        self.index_button.Disable()
+        self.status.SetLabel(f'Indexing {root}...')
+        threading.Thread(target=self.index, args=(root,), daemon=True).start()
+
+    def index(self, root):
+        # SQLite connections can't be shared between threads, so the indexer gets its own
+        library = Library(self.library.path)
+        try:
+            indexed, removed = library.update(
+                root, callback=lambda done, total: wx.CallAfter(self.status.SetLabel, f'Indexed {done}/{total}'),
+                cache=self.parent.cache)
+            msg = f'Indexed {indexed} and removed {removed} moveset(s), {library.count()} in total'
+        except Exception as e:
+            msg = f'Indexing failed: {e}'
+        finally:
+            library.close()
+        wx.CallAfter(self.on_indexed, msg)
+
+    def on_indexed(self, msg):
+        self.indexing = False
+        self.index_button.Enable()
+        self.status.SetLabel(msg)
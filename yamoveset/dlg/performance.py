@@ -0,0 +1,68 @@
+import time
+
+import wx
+
+from yamoveset import perf
+
+
+class PerformanceDialog(wx.Dialog):
+    # The last operations with their time, and the spans and counters of the selected one
+    def __init__(self, parent, *args, **kw):
+        super().__init__(parent, *args, **kw, style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.SetTitle("Performance")
+        self.operations = []
+        sizer = wx.BoxSizer(wx.VERTICAL)
+
+        self.operation_list = wx.ListCtrl(self, size=(600, 250), style=wx.LC_REPORT | wx.LC_HRULES | wx.LC_SINGLE_SEL)
+        for col, (label, width) in enumerate([('Time', 80), ('Operation', 150), ('Duration (ms)', 100),
+                                              ('Slowest', 250)]):
+            self.operation_list.InsertColumn(col, label, width=width)
+        self.operation_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_select)
+        sizer.Add(self.operation_list, 1, wx.ALL | wx.EXPAND, 10)
+
+        self.detail_list = wx.ListCtrl(self, size=(600, 200), style=wx.LC_REPORT | wx.LC_HRULES)
+        for col, (label, width) in enumerate([('Span / counter', 250), ('Count', 80), ('Total (ms)', 100),
+                                              ('Share', 80)]):
+            self.detail_list.InsertColumn(col, label, width=width)
+        sizer.Add(self.detail_list, 1, wx.LEFT | wx.RIGHT | wx.EXPAND, 10)
+
+        profile_dir = perf.recorder.profile_dir
+        label = f'Profiles are written to {profile_dir}' if profile_dir else 'Start with --profile DIR to write profiles'
+        sizer.Add(wx.StaticText(self, label=label), 0, wx.ALL, 10)
+        sizer.Add(self.CreateButtonSizer(wx.CLOSE), 0, wx.CENTER | wx.BOTTOM, 10)
+        self.Bind(wx.EVT_BUTTON, lambda _: self.Hide(), id=wx.ID_CLOSE)
+
+        self.SetSizer(sizer)
+        sizer.Fit(self)
+        self.CenterOnParent()
+        self.Layout()
+        self.refresh()
+
+    def refresh(self):
+        # Newest first
+        self.operations = list(reversed(perf.recorder.operations))
+        self.operation_list.DeleteAllItems()
+        for row, operation in enumerate(self.operations):
+            self.operation_list.InsertItem(row, time.strftime('%H:%M:%S', time.localtime(operation.started)))
+            self.operation_list.SetItem(row, 1, operation.name)
+            self.operation_list.SetItem(row, 2, f'{operation.seconds * 1000:.1f}')
+            self.operation_list.SetItem(row, 3, operation.slowest())
+        self.detail_list.DeleteAllItems()
+        if self.operations:
+            self.operation_list.Select(0)
+
+    def on_select(self, event):
+        operation = self.operations[event.GetIndex()]
+        self.detail_list.DeleteAllItems()
+        row = 0
+        for name, (count, seconds) in sorted(operation.spans.items(), key=lambda item: -item[1][1]):
+            self.detail_list.InsertItem(row, name)
+            self.detail_list.SetItem(row, 1, str(count))
+            self.detail_list.SetItem(row, 2, f'{seconds * 1000:.1f}')
+            # Spans on worker threads overlap, so shares can add up to more than 100%
+            self.detail_list.SetItem(row, 3, f'{seconds / operation.seconds:.0%}' if operation.seconds else '')
+            row += 1
+        for name, count in sorted(operation.counters.items()):
+            self.detail_list.InsertItem(row, name)
+            self.detail_list.SetItem(row, 1, str(count))
+            row += 1
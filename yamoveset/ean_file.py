@@ -0,0 +1,178 @@
+from collections import namedtuple
+import copy
+import mmap
+import os
+import struct
+
+from pyxenoverse.ean.animation import Animation as EanAnimation
+
+EAN_SIGNATURE = b'#EAN'
+EAN_HEADER_SIZE = 0x20
+EAN_ENDIANS = {b'\xfe\xff': '<', b'\xff\xfe': '>'}
+
+EanLayout = namedtuple('EanLayout', [
+    'endian', 'skeleton_offset', 'keyframes_offset', 'names_offset', 'offsets', 'name_offsets'])
+
+
+def read_layout(data):
+    # Header and offset tables of an EAN, None if the data doesn't look exactly like expected
+    try:
+        if len(data) < EAN_HEADER_SIZE or data[:4] != EAN_SIGNATURE:
+            return None
+        endian = EAN_ENDIANS.get(data[4:6])
+        if endian is None:
+            return None
+        count, = struct.unpack_from(endian + 'H', data, 0x12)
+        skeleton_offset, keyframes_offset, names_offset = struct.unpack_from(endian + 'III', data, 0x14)
+        offsets = struct.unpack_from(f'{endian}{count}I', data, keyframes_offset)
+        name_offsets = struct.unpack_from(f'{endian}{count}I', data, names_offset)
+    except struct.error:
+        return None
+    if not all(EAN_HEADER_SIZE <= offset < len(data) for offset in offsets + name_offsets):
+        return None
+    return EanLayout(endian, skeleton_offset, keyframes_offset, names_offset, list(offsets), list(name_offsets))
+
+
+def read_names(data, layout):
+    names = []
+    for name_offset in layout.name_offsets:
+        end = data.find(b'\0', name_offset)
+        if end == -1:
+            return None
+        names.append(data[name_offset:end].decode('utf-8'))
+    return names
+
+
+def read_ean_index(path):
+    # Reads the animation names and keyframe offsets straight from the header tables without decoding anything.
+    # Returns None if the file doesn't look exactly like expected, so it gets fully parsed instead.
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            layout = read_layout(data)
+            names = read_names(data, layout) if layout else None
+            return (names, layout.offsets) if names is not None else None
+    except (OSError, ValueError):
+        return None
+
+
+def animation_blocks(layout):
+    # (start, end) of every animation. Only when they are stored back to back in index order, after the skeleton
+    # and keyframe offset table and before the name table, as then nothing else has to move when they change size.
+    offsets = layout.offsets
+    if not offsets:
+        return None
+    ends = offsets[1:] + [layout.names_offset]
+    if layout.skeleton_offset >= offsets[0] or layout.keyframes_offset + 4 * len(offsets) > offsets[0]:
+        return None
+    if any(end <= start for start, end in zip(offsets, ends)):
+        return None
+    if any(offset < layout.names_offset + 4 * len(offsets) for offset in layout.name_offsets):
+        return None
+    return list(zip(offsets, ends))
+
+
+def read_animation_blocks(path):
+    # Bytes every animation is stored as, without the padding after it. None if they aren't laid out as expected.
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            layout = read_layout(data)
+            blocks = animation_blocks(layout) if layout else None
+            return [data[start:end].rstrip(b'\0') for start, end in blocks] if blocks is not None else None
+    except (OSError, ValueError):
+        return None
+
+
+def common_alignment(offsets):
+    # Keep the animations and name table on whatever boundary the encoder puts them, up to 16 bytes
+    alignment = 16
+    while alignment > 1 and any(offset % alignment for offset in offsets):
+        alignment //= 2
+    return alignment
+
+
+def splice_ean(ean, original_path, dirty, path):
+    # Writes ean to path, copying the animations that are not in dirty as raw bytes from original_path, which they
+    # are unchanged from. Only the dirty animations and the tables are encoded. Returns False if the files don't
+    # allow it, then path has to be written normally.
+    with open(original_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as original:
+        layout = read_layout(original)
+        blocks = animation_blocks(layout) if layout else None
+        if blocks is None:
+            return False
+        count = len(ean.animations)
+        clean = [index for index in range(min(count, len(blocks))) if index not in dirty]
+        if not clean:
+            return False
+
+        # Everything that gets copied is encoded as an empty animation with the same name, except for one that is
+        # compared against the original to make sure an animation encodes to the same bytes wherever it ends up.
+        # That only shows anything if it ends up somewhere else, which the last one does unless nothing before it
+        # changed size.
+        probe = clean[-1]
+        clean = set(clean[:-1])
+        subset = copy.copy(ean)
+        subset.animations = [
+            empty_animation(ean, animation) if index in clean else animation
+            for index, animation in enumerate(ean.animations)]
+        subset_path = path + '.subset'
+        try:
+            subset.save(subset_path)
+            with open(subset_path, 'rb') as subset_file:
+                encoded = subset_file.read()
+        finally:
+            if os.path.exists(subset_path):
+                os.remove(subset_path)
+
+        encoded_layout = read_layout(encoded)
+        encoded_blocks = animation_blocks(encoded_layout) if encoded_layout else None
+        if encoded_blocks is None or len(encoded_blocks) != count or encoded_layout.endian != layout.endian:
+            return False
+        start, end = encoded_blocks[probe]
+        original_start, original_end = blocks[probe]
+        if encoded[start:end].rstrip(b'\0') != original[original_start:original_end].rstrip(b'\0'):
+            return False
+        clean.add(probe)
+        probe_moved = start != original_start
+
+        endian = layout.endian
+        block_alignment = common_alignment(layout.offsets + encoded_layout.offsets)
+        names_alignment = common_alignment([layout.names_offset, encoded_layout.names_offset])
+        prefix = bytearray(encoded[:encoded_blocks[0][0]])
+        position = len(prefix)
+        offsets = []
+        for index in range(count):
+            start, end = blocks[index] if index in clean else encoded_blocks[index]
+            position += -position % block_alignment
+            offsets.append(position)
+            position += end - start
+        # A probe that stayed in place can't tell whether blocks hold absolute offsets, so they all have to stay
+        if not probe_moved and any(offsets[index] != blocks[index][0] for index in clean):
+            return False
+        position += -position % names_alignment
+        names = bytearray(encoded[encoded_layout.names_offset:])
+        shift = position - encoded_layout.names_offset
+        struct.pack_into(f'{endian}{count}I', names, 0, *[offset + shift for offset in encoded_layout.name_offsets])
+        struct.pack_into(f'{endian}{count}I', prefix, encoded_layout.keyframes_offset, *offsets)
+        struct.pack_into(endian + 'I', prefix, 0x1C, position)
+
+        with open(path, 'wb') as out:
+            out.write(prefix)
+            for index, offset in enumerate(offsets):
+                out.write(b'\0' * (offset - out.tell()))
+                if index in clean:
+                    start, end = blocks[index]
+                    out.write(original[start:end])
+                else:
+                    start, end = encoded_blocks[index]
+                    out.write(encoded[start:end])
+            out.write(b'\0' * (position - out.tell()))
+            out.write(names)
+
+    index = read_ean_index(path)
+    return index is not None and index[0] == [animation.name for animation in ean.animations]
+
+
+def empty_animation(ean, animation):
+    empty = EanAnimation(ean)
+    empty.name = animation.name
+    return empty
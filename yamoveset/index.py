@@ -0,0 +1,177 @@
+from collections import defaultdict
+import hashlib
+import struct
+
+from pyxenoverse.bac.sub_entry import ITEM_TYPES
+
+# Back references and labels that don't change what an animation does
+HASH_EXCLUDED = {'ean', 'name', 'parent', 'animation', 'index'}
+
+
+class ReferenceIndex:
+    # (item_type, entry_pair, depend_value, value) -> ids of the BAC entries referencing it
+    def __init__(self, bac=None, item_types=None):
+        self.item_types = item_types
+        self.refs = defaultdict(set)
+        self.entry_keys = {}
+        if bac is not None:
+            for entry in bac.entries:
+                self.add_entry(entry)
+
+    def keys(self, entry):
+        keys = set()
+        for sub_entry in entry.sub_entries:
+            item_type = ITEM_TYPES[sub_entry.type]
+            if self.item_types is not None and item_type not in self.item_types:
+                continue
+            for entry_pair in item_type.dependencies:
+                for item in sub_entry.items:
+                    keys.add((item_type, entry_pair, item[entry_pair[1]], item[entry_pair[0]]))
+        return keys
+
+    def add_entry(self, entry):
+        keys = self.keys(entry)
+        self.entry_keys[id(entry)] = keys
+        for key in keys:
+            self.refs[key].add(id(entry))
+
+    def remove_entry(self, entry):
+        for key in self.entry_keys.pop(id(entry), ()):
+            refs = self.refs[key]
+            refs.discard(id(entry))
+            if not refs:
+                del self.refs[key]
+
+    def update_entry(self, entry):
+        self.remove_entry(entry)
+        self.add_entry(entry)
+
+    def is_referenced(self, key, exclude=()):
+        refs = self.refs.get(key)
+        if not refs:
+            return False
+        return not refs.issubset(exclude)
+
+
+def update_hash(h, obj, seen):
+    if obj is None or isinstance(obj, (bool, int, str)):
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode('utf-8'))
+    elif isinstance(obj, float):
+        h.update(b'f' + struct.pack('<d', obj))
+    elif isinstance(obj, (bytes, bytearray)):
+        h.update(f'b{len(obj)}:'.encode('utf-8'))
+        h.update(obj)
+    elif id(obj) in seen:
+        h.update(b'@')
+    elif isinstance(obj, (list, tuple)):
+        seen.add(id(obj))
+        h.update(f'[{len(obj)}'.encode('utf-8'))
+        for value in obj:
+            update_hash(h, value, seen)
+        h.update(b']')
+    elif isinstance(obj, dict):
+        seen.add(id(obj))
+        h.update(f'{{{len(obj)}'.encode('utf-8'))
+        for key in sorted(obj, key=repr):
+            if key in HASH_EXCLUDED:
+                continue
+            update_hash(h, key, seen)
+            update_hash(h, obj[key], seen)
+        h.update(b'}')
+    elif hasattr(obj, '__dict__'):
+        seen.add(id(obj))
+        h.update(type(obj).__name__.encode('utf-8'))
+        update_hash(h, vars(obj), seen)
+    else:
+        h.update(repr(obj).encode('utf-8'))
+
+
+def skeleton_key(ean):
+    # Bone indices only mean the same thing between EANs with the same bones
+    bones = getattr(getattr(ean, 'skeleton', None), 'bones', None) or []
+    return '|'.join(getattr(bone, 'name', '') for bone in bones)
+
+
+def content_hash(animation, key=''):
+    h = hashlib.sha1(key.encode('utf-8'))
+    update_hash(h, animation, {id(animation.ean)} if hasattr(animation, 'ean') else set())
+    return h.digest()
+
+
+def animation_hashes(ean):
+    key = skeleton_key(ean)
+    return [content_hash(animation, key) for animation in ean.animations]
+
+
+def block_hash(block, key=''):
+    # Hash of an animation as stored in an EAN file. Much faster than walking the decoded animation, but it only
+    # matches the same animation stored by the same encoder, so content_hash is left for animations made in memory.
+    h = hashlib.sha1(key.encode('utf-8'))
+    h.update(b'#block')
+    h.update(block)
+    return h.digest()
+
+
+def block_hashes(ean, blocks):
+    key = skeleton_key(ean)
+    return [block_hash(block, key) for block in blocks]
+
+
+class AnimationIndex:
+    # content hash -> indices of the animations in an EAN with that content
+    def __init__(self, ean, hashes=None):
+        self.ean = ean
+        self.key = skeleton_key(ean)
+        self.hashes = list(hashes) if hashes is not None else animation_hashes(ean)
+        self.indices = defaultdict(set)
+        for index, animation_hash in enumerate(self.hashes):
+            self.indices[animation_hash].add(index)
+
+    def hash(self, animation):
+        return content_hash(animation, self.key)
+
+    # animation_hash is given when it is already known, like for a copy of an animation with the same skeleton
+    def update(self, index, animation_hash=None):
+        if animation_hash is None:
+            animation_hash = self.hash(self.ean.animations[index])
+        if index < len(self.hashes):
+            self.indices[self.hashes[index]].discard(index)
+            self.hashes[index] = animation_hash
+        else:
+            self.hashes.extend([None] * (index + 1 - len(self.hashes)))
+            self.hashes[index] = animation_hash
+        self.indices[animation_hash].add(index)
+
+    # Returns the hashes of the animations removed
+    def truncate(self, count):
+        for index in range(count, len(self.hashes)):
+            self.indices[self.hashes[index]].discard(index)
+        removed = self.hashes[count:]
+        del self.hashes[count:]
+        return removed
+
+    def find(self, animation_hash):
+        indices = self.indices.get(animation_hash)
+        return min(indices) if indices else None
+
+
+class BdmIndex:
+    # BDM entry id -> entry, plus the highest id so new entries don't need a scan
+    def __init__(self, bdm):
+        self.entries = {}
+        self.max_id = -1
+        for entry in bdm.entries:
+            self.add(entry)
+
+    def add(self, entry):
+        self.entries.setdefault(entry.id, entry)
+        self.max_id = max(self.max_id, entry.id)
+
+    def remove(self, entry):
+        if self.entries.get(entry.id) is entry:
+            del self.entries[entry.id]
+            if entry.id == self.max_id:
+                self.max_id = max(self.entries, default=-1)
+
+    def get(self, entry_id):
+        return self.entries.get(entry_id)
@@ -0,0 +1,242 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+from pathlib import Path
+import re
+import sqlite3
+
+from yamoveset import KNOWN_ENTRIES
+from yamoveset.cache import default_cache_dir
+from yamoveset.moveset import MOVESET_FILES, load_single_file
+from yamoveset.session import ITEM_FILES, MovesetSession
+
+# Bump when what gets stored for a file changes, every file is then indexed again
+LIBRARY_VERSION = 1
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS movesets (
+    id INTEGER PRIMARY KEY,
+    dirname TEXT NOT NULL,
+    code TEXT NOT NULL,
+    UNIQUE (dirname, code)
+);
+CREATE TABLE IF NOT EXISTS files (
+    moveset_id INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    PRIMARY KEY (moveset_id, file)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    moveset_id INTEGER NOT NULL,
+    entry_index INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entry_values (
+    moveset_id INTEGER NOT NULL,
+    entry_index INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS animations (
+    moveset_id INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    animation_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hitboxes (
+    moveset_id INTEGER NOT NULL,
+    bdm_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_moveset ON entries (moveset_id, entry_index);
+CREATE INDEX IF NOT EXISTS entry_values_moveset ON entry_values (moveset_id, entry_index);
+CREATE INDEX IF NOT EXISTS entry_values_value ON entry_values (moveset_id, file, value);
+CREATE INDEX IF NOT EXISTS animations_moveset ON animations (moveset_id, file, animation_index);
+CREATE INDEX IF NOT EXISTS animations_name ON animations (name);
+CREATE INDEX IF NOT EXISTS animations_hash ON animations (hash);
+CREATE INDEX IF NOT EXISTS hitboxes_moveset ON hitboxes (moveset_id);
+'''
+
+# Tables filled from each file, everything else only depends on the BAC
+FILE_TABLES = {
+    'bac': ['entries', 'entry_values'],
+    'ean': ['animations'],
+    'cam_ean': ['animations'],
+    'bdm': ['hitboxes'],
+}
+
+
+def default_library_path():
+    return os.path.join(os.path.dirname(default_cache_dir()), 'library.sqlite')
+
+
+def find_movesets(root):
+    # (dirname, code) of every moveset below root
+    movesets = []
+    for path in sorted(Path(root).rglob('*_PLAYER.bac')):
+        match = re.match(r'(\w{3})_PLAYER.bac', path.name)
+        if match:
+            movesets.append((os.path.normcase(os.path.abspath(path.parent)), match[1]))
+    return movesets
+
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Runs in a worker process. Returns file -> rows for its tables, without the moveset id
+def index_files(dirname, code, attrs, cache=None):
+    rows = {}
+    for attr, filename, obj_class, filetype, _ in MOVESET_FILES:
+        if attr not in attrs:
+            continue
+        obj, _, hashes = load_single_file(os.path.join(dirname, filename.format(code=code)), obj_class, filetype,
+                                          cache=cache)
+        if obj is None:
+            rows[attr] = {}
+        elif attr == 'bac':
+            entries, values = [], []
+            for entry in obj.entries:
+                entries.append((entry.index, KNOWN_ENTRIES.get(entry.index, '')))
+                for item_type, _, _, entry_values in MovesetSession.character_values(entry.get_static_values()):
+                    values.extend((entry.index, ITEM_FILES[item_type], value) for value in entry_values)
+            rows[attr] = {'entries': entries, 'entry_values': values}
+        elif attr == 'bdm':
+            rows[attr] = {'hitboxes': [(entry.id,) for entry in obj.entries]}
+        else:
+            rows[attr] = {'animations': [
+                (attr, index, animation.name, animation_hash)
+                for index, (animation, animation_hash) in enumerate(zip(obj.animations, hashes))]}
+    return rows
+
+
+class Library:
+    # Persistent SQLite index of the BAC entries, animations and hitboxes of every moveset below some directories
+    def __init__(self, path=None):
+        self.path = path or default_library_path()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        with self.connection:
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] != LIBRARY_VERSION:
+                self.connection.execute('DELETE FROM files')
+                self.connection.execute(f'PRAGMA user_version = {LIBRARY_VERSION}')
+
+    def close(self):
+        self.connection.close()
+
+    def moveset_id(self, dirname, code):
+        row = self.connection.execute(
+            'SELECT id FROM movesets WHERE dirname = ? AND code = ?', (dirname, code)).fetchone()
+        if row:
+            return row[0]
+        return self.connection.execute(
+            'INSERT INTO movesets (dirname, code) VALUES (?, ?)', (dirname, code)).lastrowid
+
+    def changed_files(self, moveset_id, dirname, code):
+        stored = {file: (size, mtime_ns) for file, size, mtime_ns in self.connection.execute(
+            'SELECT file, size, mtime_ns FROM files WHERE moveset_id = ?', (moveset_id,))}
+        changed = {}
+        for attr, filename, _, _, _ in MOVESET_FILES:
+            stat = file_stat(os.path.join(dirname, filename.format(code=code)))
+            if stored.get(attr) != stat:
+                changed[attr] = stat
+        return changed
+
+    def store(self, moveset_id, attr, stat, rows):
+        for table in FILE_TABLES[attr]:
+            if table == 'animations':
+                self.connection.execute(
+                    'DELETE FROM animations WHERE moveset_id = ? AND file = ?', (moveset_id, attr))
+            else:
+                self.connection.execute(f'DELETE FROM {table} WHERE moveset_id = ?', (moveset_id,))
+            table_rows = rows.get(table, [])
+            if table_rows:
+                placeholders = ', '.join('?' * (len(table_rows[0]) + 1))
+                self.connection.executemany(
+                    f'INSERT INTO {table} VALUES ({placeholders})', [(moveset_id,) + row for row in table_rows])
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', (moveset_id, attr) + stat)
+
+    def remove(self, moveset_id):
+        for table in ['files', 'entries', 'entry_values', 'animations', 'hitboxes']:
+            self.connection.execute(f'DELETE FROM {table} WHERE moveset_id = ?', (moveset_id,))
+        self.connection.execute('DELETE FROM movesets WHERE id = ?', (moveset_id,))
+
+    # Indexes every moveset below root, only reading the files that changed since the last time.
+    # callback(done, total) is called after every moveset. Returns the number of movesets indexed and removed.
+    def update(self, root, max_workers=None, callback=None, cache=None):
+        root = os.path.normcase(os.path.abspath(root))
+        found = find_movesets(root)
+        with self.connection:
+            work = []
+            for dirname, code in found:
+                moveset_id = self.moveset_id(dirname, code)
+                changed = self.changed_files(moveset_id, dirname, code)
+                if changed:
+                    work.append((moveset_id, dirname, code, changed))
+
+            # Movesets that disappeared from below root
+            found = set(found)
+            removed = 0
+            for moveset_id, dirname, code in self.connection.execute(
+                    'SELECT id, dirname, code FROM movesets').fetchall():
+                if (dirname == root or dirname.startswith(os.path.join(root, ''))) and (dirname, code) not in found:
+                    self.remove(moveset_id)
+                    removed += 1
+
+        if work:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(index_files, dirname, code, set(changed), cache)
+                           for _, dirname, code, changed in work]
+                for done, ((moveset_id, _, _, changed), future) in enumerate(zip(work, futures), 1):
+                    rows = future.result()
+                    # One transaction per moveset, so an interrupted run keeps what it finished
+                    with self.connection:
+                        for attr, stat in changed.items():
+                            self.store(moveset_id, attr, stat, rows[attr])
+                    if callback:
+                        callback(done, len(work))
+        return len(work), removed
+
+    # (code, dirname, file, animation index, animation name, entries using it) of every animation matching a
+    # name pattern, * matches anything. Without wildcards, any name containing it matches.
+    def find_animations(self, pattern):
+        if not any(c in pattern for c in '*?['):
+            pattern = f'*{pattern}*'
+        return self.with_entries(self.connection.execute(
+            'SELECT m.id, m.code, m.dirname, a.file, a.animation_index, a.name FROM animations a '
+            'JOIN movesets m ON m.id = a.moveset_id WHERE a.name GLOB ? ORDER BY m.code, a.file, a.animation_index',
+            (pattern,)).fetchall())
+
+    # Same as find_animations, for animations of other movesets identical to the ones entry_index of code uses
+    def find_identical(self, code, entry_index, dirname=None):
+        query = ('SELECT DISTINCT a.hash FROM entry_values v JOIN movesets m ON m.id = v.moveset_id '
+                 'JOIN animations a ON a.moveset_id = v.moveset_id AND a.file = v.file '
+                 'AND a.animation_index = v.value WHERE m.code = ? AND v.entry_index = ?')
+        params = [code, entry_index]
+        if dirname:
+            query += ' AND m.dirname = ?'
+            params.append(os.path.normcase(os.path.abspath(dirname)))
+        hashes = [row[0] for row in self.connection.execute(query, params)]
+        if not hashes:
+            return []
+        return self.with_entries(self.connection.execute(
+            f'SELECT m.id, m.code, m.dirname, a.file, a.animation_index, a.name FROM animations a '
+            f'JOIN movesets m ON m.id = a.moveset_id WHERE a.hash IN ({", ".join("?" * len(hashes))}) '
+            f'ORDER BY m.code, a.file, a.animation_index', hashes).fetchall())
+
+    def with_entries(self, rows):
+        results = []
+        for moveset_id, code, dirname, file, animation_index, name in rows:
+            entries = [row[0] for row in self.connection.execute(
+                'SELECT DISTINCT entry_index FROM entry_values WHERE moveset_id = ? AND file = ? AND value = ? '
+                'ORDER BY entry_index', (moveset_id, file, animation_index))]
+            results.append((code, dirname, file, animation_index, name, entries))
+        return results
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM movesets').fetchone()[0]
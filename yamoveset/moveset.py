@@ -0,0 +1,389 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+import os
+from pathlib import Path
+import re
+import shutil
+import threading
+import time
+
+from yamoveset import perf
+from yamoveset.ean_file import read_animation_blocks, read_ean_index, splice_ean
+from yamoveset.index import animation_hashes, block_hashes
+from pyxenoverse.bac import BAC
+from pyxenoverse.bdm import BDM
+from pyxenoverse.ean import EAN
+
+# (attribute, filename, class, filetype, optional)
+MOVESET_FILES = [
+    ('bac', '{code}_PLAYER.bac', BAC, 'BAC', False),
+    ('ean', '{code}.ean', EAN, 'EAN', False),
+    ('bdm', '{code}_PLAYER.bdm', BDM, 'BDM', True),
+    ('cam_ean', '{code}.cam.ean', EAN, 'CAM.EAN', True),
+]
+MOVESET_ATTRS = [attr for attr, _, _, _, _ in MOVESET_FILES]
+MOVESET_FILENAMES = {attr: filename for attr, filename, _, _, _ in MOVESET_FILES}
+
+
+class Moveset:
+    def __init__(self, dirname='', code=''):
+        self.dirname = dirname
+        self.code = code
+        self.bac = None
+        self.bdm = None
+        self.ean = None
+        self.cam_ean = None
+        # attribute -> content hash of every animation, computed while loading
+        self.hashes = {}
+
+
+def find_character_codes(dirname):
+    character_codes = []
+    for f in Path(dirname).glob('*_PLAYER.bac'):
+        match = re.match(r'(\w{3})_PLAYER.bac', f.name)
+        if match:
+            character_codes.append(match[1])
+    return character_codes
+
+
+def file_not_found_message(filetype, skip=False):
+    msg = f'No Valid {filetype} file found'
+    if skip:
+        msg += ' but skipping anyway.\n' \
+               'WARNING: May be unable to copy/paste certain moves moves that require this file'
+    return msg
+
+
+def file_invalid_message(filename, filetype, skip=False):
+    msg = f'{filename} is not a valid {filetype}'
+    if skip:
+        msg += ' but skipping anyway.\n' \
+               'WARNING: May be unable to copy/paste certain moves moves that require this file'
+    return msg
+
+
+class LazyEanError(Exception):
+    # A lazily loaded EAN that can't be decoded when it is needed, because its file changed or doesn't parse
+    pass
+
+
+class LazyEan:
+    # Stands in for an EAN of which only the animation names have been read. The file is decoded the first time
+    # anything else is asked of it, which is when animations get pasted from/into it or it gets saved.
+    def __init__(self, path, names, offsets, cache=None):
+        stat = os.stat(path)
+        self.path = path
+        self.names = names
+        self.offsets = offsets
+        self.stat = (stat.st_size, stat.st_mtime_ns)
+        self.cache = cache
+        self.ean = None
+        self.hashes = None
+
+    def __getattr__(self, name):
+        # Only called for what the proxy doesn't have itself. The own attributes are excluded so unpickling,
+        # which looks things up before __dict__ is filled, doesn't end up decoding.
+        if name.startswith('__') or name in LAZY_EAN_ATTRS:
+            raise AttributeError(name)
+        return getattr(self.decode(), name)
+
+    @property
+    def decoded(self):
+        return self.ean is not None
+
+    def decode(self):
+        if self.ean is None:
+            if not self.unchanged_on_disk():
+                raise LazyEanError(f'{os.path.basename(self.path)} has changed since it was opened. '
+                                   f'Please reload the moveset')
+            ean, warning, hashes = load_single_file(self.path, EAN, cache=self.cache)
+            if ean is None:
+                raise LazyEanError(warning)
+            self.ean, self.hashes = ean, hashes
+        return self.ean
+
+    def content_hashes(self):
+        self.decode()
+        return self.hashes
+
+    def unchanged_on_disk(self):
+        stat = os.stat(self.path)
+        return (stat.st_size, stat.st_mtime_ns) == self.stat
+
+    def save_spliced(self, path, dirty):
+        # Copies everything that isn't dirty straight from the file it was loaded from. False if it has to be saved
+        # the normal way.
+        if not self.unchanged_on_disk():
+            return False
+        if self.ean is None:
+            shutil.copyfile(self.path, path)
+            return True
+        return splice_ean(self.ean, self.path, dirty, path)
+
+    def rebase(self, path):
+        # The file just saved to has the same content, so it's what the next save copies from
+        stat = os.stat(path)
+        self.path = path
+        self.stat = (stat.st_size, stat.st_mtime_ns)
+        index = read_ean_index(path)
+        self.offsets = index[1] if index is not None else []
+
+    def animation_count(self):
+        return len(self.ean.animations) if self.ean is not None else len(self.names)
+
+    def animation_name(self, index):
+        if not 0 <= index < self.animation_count():
+            return ''
+        return self.ean.animations[index].name if self.ean is not None else self.names[index]
+
+    def animation_sizes(self):
+        # Bytes every animation takes up in the file, as far as the offsets tell. None where they don't.
+        offsets = self.offsets
+        if any(end <= start for start, end in zip(offsets, offsets[1:])):
+            return [None] * len(offsets)
+        return [end - start for start, end in zip(offsets, offsets[1:])] + [None] * bool(offsets)
+
+
+LAZY_EAN_ATTRS = {'path', 'names', 'offsets', 'stat', 'cache', 'ean', 'hashes'}
+
+
+def decoded(obj):
+    return obj.decode() if isinstance(obj, LazyEan) else obj
+
+
+def ean_hashes(ean):
+    # A lazily loaded EAN gets its hashes along with the decoded file, possibly straight from the cache
+    return ean.content_hashes() if isinstance(ean, LazyEan) else animation_hashes(ean)
+
+
+def file_hashes(path, ean):
+    # Hashes the animations as stored in the file they were just loaded from, only walking the decoded animations
+    # if the file doesn't lay them out as expected
+    blocks = read_animation_blocks(path)
+    if blocks is None or len(blocks) != len(ean.animations):
+        return animation_hashes(ean)
+    return block_hashes(ean, blocks)
+
+
+# Runs in a worker process, so it only takes and returns picklable values
+@perf.timed('load_single_file')
+def load_single_file(path, obj_class, filetype=None, skip=False, cache=None, lazy=False):
+    if not filetype:
+        filetype = obj_class.__name__
+    if not os.path.isfile(path):
+        return None, file_not_found_message(filetype, skip), None
+    if lazy and obj_class is EAN:
+        index = read_ean_index(path)
+        if index is not None:
+            return LazyEan(path, *index, cache), None, None
+    if cache is not None:
+        cached = cache.get(path, obj_class)
+        if cached is not None:
+            return cached
+
+    new_obj = obj_class()
+    if not new_obj.load(path):
+        return None, file_invalid_message(os.path.basename(path), filetype, skip), None
+    hashes = file_hashes(path, new_obj) if isinstance(new_obj, EAN) else None
+    if cache is not None:
+        cache.put(path, obj_class, (new_obj, None, hashes))
+    return new_obj, None, hashes
+
+
+def build_moveset(dirname, code, results):
+    moveset = Moveset(dirname, code)
+    warnings = []
+    for attr, _, _, _, optional in MOVESET_FILES:
+        obj, warning, hashes = results[attr]
+        if warning:
+            warnings.append(warning)
+        if obj is None and not optional:
+            moveset = None
+        if moveset is not None:
+            setattr(moveset, attr, obj)
+            if hashes is not None:
+                moveset.hashes[attr] = hashes
+    return moveset, warnings
+
+
+def load_moveset(dirname, code, cache=None):
+    results = {}
+    for attr, filename, obj_class, filetype, optional in MOVESET_FILES:
+        results[attr] = load_single_file(
+            os.path.join(dirname, filename.format(code=code)), obj_class, filetype, optional, cache)
+    return build_moveset(dirname, code, results)
+
+
+class MovesetLoader:
+    # Parses all moveset files at once on an executor. callback(loader) is called from a worker thread
+    # every time a file finishes. Files that are unchanged since they were last parsed come from the cache, and with
+    # lazy EANs only get their animation names read until they are needed. The time until each file is done is
+    # added to operation, if given.
+    def __init__(self, dirname, code, executor, callback=None, cache=None, lazy=False, operation=None):
+        self.dirname = dirname
+        self.code = code
+        self.cancelled = False
+        self.futures = {}
+        start = time.perf_counter()
+        for attr, filename, obj_class, filetype, optional in MOVESET_FILES:
+            self.futures[attr] = executor.submit(
+                load_single_file, os.path.join(dirname, filename.format(code=code)), obj_class, filetype, optional,
+                cache, lazy)
+            if operation is not None:
+                self.futures[attr].add_done_callback(lambda _, attr=attr: operation.add_span(
+                    f'load_single_file {attr}', time.perf_counter() - start))
+        if callback:
+            for future in self.futures.values():
+                future.add_done_callback(lambda _: callback(self))
+
+    def progress(self):
+        return sum(future.done() for future in self.futures.values())
+
+    def total(self):
+        return len(self.futures)
+
+    def done(self):
+        return self.cancelled or self.progress() == self.total()
+
+    def cancel(self):
+        self.cancelled = True
+        for future in self.futures.values():
+            future.cancel()
+
+    def result(self):
+        if self.cancelled:
+            return None, []
+        return build_moveset(self.dirname, self.code, {
+            attr: future.result() for attr, future in self.futures.items()})
+
+
+class SaveCancelled(Exception):
+    pass
+
+
+def temp_path(path):
+    return path + '.tmp'
+
+
+# Writes obj next to path, it only replaces path once all files of the moveset are written
+@perf.timed('write_single_file')
+def write_single_file(obj, path, dirty=None):
+    try:
+        # Lazily loaded EANs only encode the animations in dirty
+        if not isinstance(obj, LazyEan) or dirty is None or not obj.save_spliced(temp_path(path), dirty):
+            decoded(obj).save(temp_path(path))
+    except BaseException:
+        if os.path.exists(temp_path(path)):
+            os.remove(temp_path(path))
+        raise
+
+
+def replace_single_file(obj, path):
+    os.replace(temp_path(path), path)
+    if isinstance(obj, LazyEan):
+        obj.rebase(path)
+
+
+# dirty_entries: attribute -> indices that differ from the file the attribute was loaded or last saved from.
+# progress(attr) is called from a worker thread whenever a file is written, cancelled() is asked once they all are.
+# backup(dirname, code) is called after that, right before the old files are replaced.
+@perf.timed('save_moveset')
+def save_moveset(moveset, dirname, code, attrs=None, backup=None, dirty_entries=None, progress=None, cancelled=None):
+    if attrs is None:
+        attrs = [attr for attr in MOVESET_ATTRS if getattr(moveset, attr) is not None]
+    if not attrs:
+        return []
+    filenames = {attr: MOVESET_FILENAMES[attr].format(code=code) for attr in attrs}
+    paths = {attr: os.path.join(dirname, filenames[attr]) for attr in attrs}
+
+    # Write every file next to its target first and only swap them in once they are all there, so a failed or
+    # cancelled save leaves the old files as they were
+    replaced = set()
+    try:
+        # Serializing is mostly done in python, but the writes still overlap
+        with ThreadPoolExecutor(max_workers=len(attrs)) as executor:
+            futures = {executor.submit(
+                write_single_file, getattr(moveset, attr), paths[attr],
+                dirty_entries.get(attr, set()) if dirty_entries is not None else None): attr for attr in attrs}
+            for future in as_completed(futures):
+                future.result()
+                if progress:
+                    progress(futures[future])
+        if cancelled is not None and cancelled():
+            raise SaveCancelled()
+        if backup:
+            backup(dirname, code)
+        for attr in attrs:
+            replace_single_file(getattr(moveset, attr), paths[attr])
+            replaced.add(attr)
+    finally:
+        for attr in attrs:
+            if attr not in replaced and os.path.exists(temp_path(paths[attr])):
+                os.remove(temp_path(paths[attr]))
+    return [filenames[attr] for attr in attrs]
+
+
+class MovesetSaver:
+    # Saves a moveset on a worker thread so the window keeps responding. What to save is taken when it starts, but
+    # the objects themselves are saved as they are, so the moveset must not be edited until it is done.
+    # callback(saver) is called from the worker thread every time a file is written and once the save is over.
+    # The time until each file is written is added to operation, if given.
+    def __init__(self, moveset, dirname, code, attrs=None, backup=None, dirty_entries=None, callback=None,
+                 operation=None):
+        self.dirname = dirname
+        self.code = code
+        self.moveset = Moveset(dirname, code)
+        for attr in MOVESET_ATTRS:
+            setattr(self.moveset, attr, getattr(moveset, attr))
+        if attrs is None:
+            attrs = [attr for attr in MOVESET_ATTRS if getattr(moveset, attr) is not None]
+        self.attrs = list(attrs)
+        self.dirty_entries = None if dirty_entries is None else {
+            attr: set(dirty_entries.get(attr, ())) for attr in self.attrs}
+        self.backup = backup
+        self.callback = callback
+        self.operation = operation
+        self.written = []
+        self.saved = None
+        self.error = None
+        self.cancelled = False
+        self.finished = False
+        self.start = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            with perf.attach(self.operation) if self.operation is not None else nullcontext():
+                self.saved = save_moveset(self.moveset, self.dirname, self.code, self.attrs, self.backup,
+                                          self.dirty_entries, self.on_written, lambda: self.cancelled)
+        except SaveCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        self.finished = True
+        if self.callback:
+            self.callback(self)
+
+    def on_written(self, attr):
+        self.written.append(attr)
+        if self.operation is not None:
+            self.operation.add_span(f'write_single_file {attr}', time.perf_counter() - self.start)
+        if self.callback:
+            self.callback(self)
+
+    def progress(self):
+        return len(self.written)
+
+    def total(self):
+        return len(self.attrs)
+
+    def done(self):
+        return self.finished
+
+    # Only has an effect until all files are written, after that they replace the old ones anyway
+    def cancel(self):
+        self.cancelled = True
+
+    def wait(self):
+        self.thread.join()
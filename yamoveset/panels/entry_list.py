@@ -0,0 +1,59 @@
+from wx.dataview import DataViewCtrl, DataViewVirtualListModel, DV_MULTIPLE, DV_ROW_LINES
+
+from yamoveset import KNOWN_ENTRIES
+
+CHECK = "\u2714"
+
+
+class EntryListModel(DataViewVirtualListModel):
+    # Rows are only rendered when visible, so building the list costs nothing per BAC entry
+    def __init__(self, column_count=1):
+        DataViewVirtualListModel.__init__(self, 0)
+        self.column_count = column_count
+        self.entries = []
+        self.marked = set()
+
+    def set_bac(self, bac):
+        self.entries = [entry for entry in bac.entries if entry.sub_entries]
+        self.marked = set()
+        self.Reset(len(self.entries))
+
+    def append(self, entry):
+        self.entries.append(entry)
+        self.RowAppended()
+        return self.GetItem(len(self.entries) - 1)
+
+    def set_marked(self, rows):
+        # Only repaint the rows whose mark actually changed
+        old_marked = self.marked
+        self.marked = set(rows)
+        for row in old_marked ^ self.marked:
+            self.RowChanged(row)
+
+    def GetColumnCount(self):
+        return self.column_count
+
+    def GetColumnType(self, col):
+        return 'string'
+
+    def GetValueByRow(self, row, col):
+        if col == 0:
+            entry = self.entries[row]
+            return f'{entry.index}: {KNOWN_ENTRIES.get(entry.index, "Unknown")}'
+        return CHECK if row in self.marked else ''
+
+    def SetValueByRow(self, value, row, col):
+        return False
+
+
+def create_entry_list(parent, model):
+    entry_list = DataViewCtrl(parent, style=DV_MULTIPLE | DV_ROW_LINES)
+    entry_list.AssociateModel(model)
+    entry_list.AppendTextColumn("BAC Entry", 0, width=300)
+    if model.column_count > 1:
+        entry_list.AppendTextColumn("Copied", 1, width=64)
+    return entry_list
+
+
+def selected_rows(entry_list, model):
+    return sorted(model.GetRow(item) for item in entry_list.GetSelections())
@@ -1,14 +1,12 @@
 import wx
-import pickle
 
-from wx.dataview import TreeListCtrl, EVT_TREELIST_ITEM_CONTEXT_MENU, TL_MULTIPLE
+from wx.dataview import EVT_DATAVIEW_ITEM_CONTEXT_MENU
 from pubsub import pub
 
-from yamoveset import KNOWN_ENTRIES
+from yamoveset.clipboard import CopyBuffer
+from yamoveset.panels.entry_list import EntryListModel, create_entry_list, selected_rows
 from pyxenoverse.gui.file_drop_target import FileDropTarget
 
-CHECK = "\u2714"
-
 
 class SidePanel(wx.Panel):
     def __init__(self, parent):
@@ -18,6 +16,7 @@ class SidePanel(wx.Panel):
         self.bdm = None
         self.ean = None
         self.cam_ean = None
+        self.hashes = {}
         self.parent = parent
         self.dirname = ''
 
@@ -32,10 +31,9 @@ class SidePanel(wx.Panel):
         self.copy.Disable()
 
         # Entry List
-        self.entry_list = TreeListCtrl(self, style=TL_MULTIPLE)
-        self.entry_list.AppendColumn("BAC Entry")
-        self.entry_list.AppendColumn("Copied", width=64)
-        self.entry_list.Bind(EVT_TREELIST_ITEM_CONTEXT_MENU, self.on_right_click)
+        self.entry_model = EntryListModel(column_count=2)
+        self.entry_list = create_entry_list(self, self.entry_model)
+        self.entry_list.Bind(EVT_DATAVIEW_ITEM_CONTEXT_MENU, self.on_right_click)
         # self.cdo = wx.CustomDataObject("BDMEntry")
 
         self.Bind(wx.EVT_BUTTON, self.on_open, id=wx.ID_OPEN)
@@ -67,13 +65,7 @@ class SidePanel(wx.Panel):
         pub.sendMessage('open_side_moveset')
 
     def build_tree(self):
-        self.entry_list.DeleteAllItems()
-        root = self.entry_list.GetRootItem()
-        for i, entry in enumerate(self.bac.entries):
-            if not entry.sub_entries:
-                continue
-            self.entry_list.AppendItem(
-                root, f'{entry.index}: {KNOWN_ENTRIES.get(entry.index, "Unknown")}', data=entry)
+        self.entry_model.set_bac(self.bac)
         self.copy.Enable()
         self.parent.copied = None
         pub.sendMessage('enable_paste', enabled=False)
@@ -88,20 +80,12 @@ class SidePanel(wx.Panel):
         menu.Destroy()
 
     def on_copy(self, _):
-        selected = self.entry_list.GetSelections()
+        selected = selected_rows(self.entry_list, self.entry_model)
         if not selected:
             return
 
-        # Deselect all
-        item = self.entry_list.GetFirstItem()
-        while item.IsOk():
-            self.entry_list.SetItemText(item, 1, '')
-            item = self.entry_list.GetNextItem(item)
-        # Check and add to copied
-        copied = []
-        for item in selected:
-            copied.append(self.entry_list.GetItemData(item))
-            self.entry_list.SetItemText(item, 1, CHECK)
-        self.parent.copied = pickle.dumps(copied)
+        # Check and add to copied, this also clears the old checks
+        self.entry_model.set_marked(selected)
+        self.parent.copied = CopyBuffer(self, [self.entry_model.entries[row] for row in selected])
         pub.sendMessage('enable_paste', enabled=True)
         pub.sendMessage('set_status_bar', text=f'Copied {len(selected)} entries')
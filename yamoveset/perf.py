@@ -0,0 +1,224 @@
+from collections import defaultdict, deque
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+MAX_OPERATIONS = 50
+
+
+class Operation:
+    # One user visible operation (a load, paste, save...) with the time spent in named spans and counters of
+    # events within it. Spans and counts can come from any thread.
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.spans = defaultdict(lambda: [0, 0.0])
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+        # cProfile of the thread it was attached to, dumped when it ends
+        self.profile = None
+
+    def add_span(self, name, seconds):
+        with self.lock:
+            span = self.spans[name]
+            span[0] += 1
+            span[1] += seconds
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+
+    def slowest(self, spans=2):
+        slowest = sorted(self.spans.items(), key=lambda item: -item[1][1])[:spans]
+        return ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, (_, seconds) in slowest)
+
+    def summary(self, spans=2):
+        text = f'{self.name} {self.seconds * 1000:.0f} ms'
+        if self.spans:
+            text += f' ({self.slowest(spans)})'
+        return text
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'started': self.started,
+            'seconds': self.seconds,
+            'spans': {name: {'count': count, 'seconds': seconds} for name, (count, seconds) in self.spans.items()},
+            'counters': dict(self.counters),
+        }
+
+
+class Span:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.operation = None
+
+    def __enter__(self):
+        self.operation = self.recorder.current
+        if self.operation is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        if self.operation is not None:
+            self.operation.add_span(self.name, time.perf_counter() - self.start)
+
+
+class Recorder:
+    # Keeps the last operations. While one is running, span() and count() on the same thread add to it, otherwise
+    # they cost next to nothing. With profile_dir set, every operation also gets a JSON dump there, plus a cProfile
+    # of the thread it ran on.
+    def __init__(self, max_operations=MAX_OPERATIONS):
+        self.operations = deque(maxlen=max_operations)
+        self.local = threading.local()
+        self.profile_dir = None
+        self.dumps = 0
+        self.listeners = []
+
+    # The operation running on this thread, so a background thread doesn't add to whatever the GUI is doing
+    @property
+    def current(self):
+        return getattr(self.local, 'current', None)
+
+    @current.setter
+    def current(self, operation):
+        self.local.current = operation
+
+    def enable_profiling(self, dirname):
+        os.makedirs(dirname, exist_ok=True)
+        self.profile_dir = dirname
+
+    # An operation that runs across events, like a load on worker processes. Nothing is added to it implicitly,
+    # its spans have to be added to it directly or by a thread it is attached to.
+    def begin(self, name):
+        return Operation(name)
+
+    def attach(self, operation):
+        return AttachedOperation(self, operation)
+
+    def end(self, operation, profile=None):
+        operation.finish()
+        profile = profile or operation.profile
+        if self.current is operation:
+            self.current = None
+        self.operations.append(operation)
+        if self.profile_dir:
+            self.dump(operation, profile)
+        for listener in self.listeners:
+            listener(operation)
+        return operation
+
+    def operation(self, name):
+        return OperationContext(self, name)
+
+    def span(self, name):
+        return Span(self, name)
+
+    def count(self, name, n=1):
+        if self.current is not None:
+            self.current.count(name, n)
+
+    # Decorator for a function that is a span of whatever operation it runs in
+    def timed(self, name):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if self.current is None:
+                    return function(*args, **kwargs)
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def dump(self, operation, profile=None):
+        self.dumps += 1
+        started = time.strftime('%Y%m%d-%H%M%S', time.localtime(operation.started))
+        name = re.sub(r'\W+', '_', operation.name)
+        basename = os.path.join(self.profile_dir, f'{started}-{self.dumps:03d}-{name}')
+        if profile is not None:
+            profile.dump_stats(basename + '.prof')
+        with open(basename + '.json', 'w', encoding='utf-8') as f:
+            json.dump(operation.to_json(), f, indent=2)
+
+
+def enable_profile(profile):
+    # Newer Pythons only allow one profiler at a time, whichever operation started second goes without
+    try:
+        profile.enable()
+    except ValueError:
+        return False
+    return True
+
+
+class OperationContext:
+    # An operation that starts and ends on the same thread, run under cProfile when profiling. Inside another
+    # operation it is just a span of that one.
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.operation = None
+        self.span = None
+        self.profile = None
+
+    def __enter__(self):
+        if self.recorder.current is not None:
+            self.span = self.recorder.span(self.name).__enter__()
+            return self.recorder.current
+        self.operation = self.recorder.current = self.recorder.begin(self.name)
+        if self.recorder.profile_dir:
+            import cProfile
+            self.profile = cProfile.Profile()
+            if not enable_profile(self.profile):
+                self.profile = None
+        return self.operation
+
+    def __exit__(self, *args):
+        if self.span is not None:
+            self.span.__exit__(*args)
+            return
+        if self.profile is not None:
+            self.profile.disable()
+        self.recorder.end(self.operation, self.profile)
+
+
+class AttachedOperation:
+    # Makes an operation begun elsewhere the current one of this thread, e.g. a save on its worker thread. It is
+    # profiled on this thread when profiling.
+    def __init__(self, recorder, operation):
+        self.recorder = recorder
+        self.operation = operation
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.recorder.current
+        self.recorder.current = self.operation
+        if self.recorder.profile_dir:
+            if self.operation.profile is None:
+                import cProfile
+                self.operation.profile = cProfile.Profile()
+            if not enable_profile(self.operation.profile):
+                self.operation.profile = None
+        return self.operation
+
+    def __exit__(self, *_):
+        if self.operation.profile is not None:
+            self.operation.profile.disable()
+        self.recorder.current = self.previous
+
+
+recorder = Recorder()
+operation = recorder.operation
+span = recorder.span
+count = recorder.count
+timed = recorder.timed
+begin = recorder.begin
+attach = recorder.attach
+end = recorder.end
@@ -0,0 +1,55 @@
+import csv
+import json
+
+from yamoveset.moveset import MOVESET_FILENAMES
+from yamoveset.session import ITEM_FILES, PASTE_TYPES
+
+REPORT_FIELDS = [
+    'file', 'source_file', 'entry_index', 'new_value', 'new_name', 'old_value', 'old_name', 'status', 'similar']
+
+
+# Existing animations that are close enough that the new one might not be needed, as listed in the Similar column
+def similar_values(suggestions, value):
+    if value.status != 'new':
+        return ''
+    similar = suggestions.get(value.item_type, {}).get(value.old_value, [])
+    return ', '.join(str(index) for index, _ in similar)
+
+
+def report_rows(changed_values, target_code, source_code, suggestions=None):
+    suggestions = suggestions or {}
+    rows = []
+    for item_type in PASTE_TYPES:
+        filename = MOVESET_FILENAMES[ITEM_FILES[item_type]]
+        for value in changed_values.get(item_type, []):
+            rows.append({
+                'file': filename.format(code=target_code),
+                'source_file': filename.format(code=source_code),
+                'entry_index': value.entry_index,
+                'new_value': value.new_value,
+                'new_name': value.new_name,
+                'old_value': value.old_value,
+                'old_name': value.old_name,
+                'status': value.status,
+                'similar': similar_values(suggestions, value),
+            })
+    return rows
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_json(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, indent=2, ensure_ascii=False)
+
+
+def write_report(path, rows):
+    if path.lower().endswith('.json'):
+        write_json(path, rows)
+    else:
+        write_csv(path, rows)
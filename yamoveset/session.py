@@ -0,0 +1,877 @@
+from collections import defaultdict, namedtuple
+import os
+
+from yamoveset import KNOWN_ENTRIES, BLACKLISTED_WORDS
+from yamoveset import perf, similarity
+from yamoveset.compact import compact_animations, compact_bdm
+from yamoveset.index import AnimationIndex, BdmIndex, ReferenceIndex, skeleton_key
+from yamoveset.moveset import MOVESET_ATTRS, MOVESET_FILENAMES, LazyEan, decoded, ean_hashes
+from pyxenoverse.bac.entry import Entry
+from pyxenoverse.bac.types.animation import Animation
+from pyxenoverse.bac.types.camera import Camera
+from pyxenoverse.bac.types.hitbox import Hitbox
+from pyxenoverse.bdm.entry import Entry as BdmEntry
+from pyxenoverse.ean.animation import Animation as EanAnimation
+
+PASTE_TYPES = [Animation, Hitbox, Camera]
+ITEM_FILES = {
+    Animation: 'ean',
+    Hitbox: 'bdm',
+    Camera: 'cam_ean',
+}
+ANIMATION_FILES = ['ean', 'cam_ean']
+
+
+def new_links():
+    return defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+
+
+def max_matching(left, edges):
+    # Maximum bipartite matching by augmenting paths, left value -> right value. A left value stays matched once it
+    # is, so the ones earlier in left win whenever not all of them can be matched.
+    match = {}
+    matched = {}
+    for start in left:
+        # Most values have a free candidate, only look for a path through the others when they don't
+        free = next((candidate for candidate in edges[start] if candidate not in match), None)
+        if free is not None:
+            match[free] = start
+            matched[start] = free
+            continue
+        parent = {}
+        stack = [(start, iter(edges[start]))]
+        while stack:
+            value, candidates = stack[-1]
+            for candidate in candidates:
+                if candidate in parent:
+                    continue
+                parent[candidate] = value
+                if candidate not in match:
+                    # Flip every edge on the path back to start
+                    while candidate is not None:
+                        value = parent[candidate]
+                        previous = matched.get(value)
+                        match[candidate] = value
+                        matched[value] = candidate
+                        candidate = previous
+                    stack = []
+                    break
+                stack.append((match[candidate], iter(edges[match[candidate]])))
+                break
+            else:
+                stack.pop()
+    return matched
+
+
+def identity_links(entry):
+    # Links every value of entry to itself, so pasting it makes an exact copy
+    links = new_links()
+    for item_type, v1 in entry.get_static_values().items():
+        for entry_pair, v2 in v1.items():
+            for depend_value, values in v2.items():
+                links[item_type][entry_pair][depend_value].update((value, value) for value in values)
+    return links
+
+
+class PasteError(Exception):
+    pass
+
+
+class ChangedValue(namedtuple('ChangedValue', ['entry_index', 'item_type', 'old_value', 'new_value',
+                                               'old_name', 'new_name', 'status'])):
+    __slots__ = ()
+
+    @property
+    def entry_string(self):
+        return f'[{self.entry_index}]'
+
+    @property
+    def old_string(self):
+        if self.item_type != Animation:
+            return str(self.old_value)
+        return f'{self.old_value} ({self.old_name})'
+
+    @property
+    def new_string(self):
+        new_string = str(self.new_value)
+        if self.item_type == Animation:
+            new_string += f' ({"*new*" if self.status == "new" else self.new_name})'
+        if self.status == 'identical':
+            new_string += ' reused (identical)'
+        return new_string
+
+
+class PasteResult:
+    def __init__(self, pairs, entries, changed_values):
+        # (target index, source index) for every BAC entry written
+        self.pairs = pairs
+        self.entries = entries
+        self.changed_values = changed_values
+
+
+# What one applied plan changed, so it can be undone and redone. Only copies of the BAC entries, animations and
+# hitboxes it overwrote are kept. Appended ones and the links are shared with the moveset, not copied.
+class Edit:
+    def __init__(self, description, links, linked_values, links_epoch):
+        self.description = description
+        # attr -> position the appended objects start at, and the objects
+        self.appended = {}
+        # (attr, index, object, copy of its content on the other side of the edit)
+        self.replaced = []
+        # (attr, index) -> content hash of the copy of a replaced animation, and attr -> those of the appended
+        # animations while they are removed, so undoing and redoing doesn't hash anything again
+        self.hashes = {}
+        self.appended_hashes = {}
+        self.links = (links, linked_values)
+        self.new_links = None
+        self.links_epoch = links_epoch
+        self.undone = False
+
+    # BAC entries touched, to select them again after undoing or redoing
+    def entries(self):
+        entries = [obj for attr, _, obj, _ in self.replaced if attr == 'bac']
+        return entries + list(self.appended.get('bac', (0, []))[1])
+
+
+# Everything a paste/add will do, worked out before anything is changed. selected is None when adding.
+class PastePlan(namedtuple('PastePlan', ['copied', 'selected', 'new_indices', 'copies', 'links', 'linked_values',
+                                         'changed_values', 'conflicts', 'added_bytes', 'generation'])):
+    __slots__ = ()
+
+    def summary(self, code):
+        lines = []
+        for item_type, new_values in self.new_indices.items():
+            attr = ITEM_FILES[item_type]
+            line = f'{MOVESET_FILENAMES[attr].format(code=code)}: {len(new_values)} new'
+            if self.added_bytes.get(attr) is not None:
+                line += f' (~{self.added_bytes[attr] / 1024:.0f} KB)'
+            lines.append(line)
+        overwritten = sum(new_value not in self.new_indices.get(item_type, ())
+                          for item_type, _, new_value in self.copies)
+        if overwritten:
+            lines.append(f'{overwritten} existing value(s) overwritten')
+        if self.conflicts:
+            lines.append(f'{len(self.conflicts)} value(s) used by other entries, new ones are added instead')
+        return lines
+
+
+class MovesetSession:
+    # target and source can be anything with code/bac/bdm/ean/cam_ean attributes (the panels, or a Moveset)
+    def __init__(self, target, source):
+        self.target = target
+        self.source = source
+        self.links = new_links()
+        self.linked_values = defaultdict(set)
+        self.references = ReferenceIndex(item_types=PASTE_TYPES)
+        self.animation_indices = {}
+        self.loaded_hashes = {}
+        # Created on first use, as it needs NumPy
+        self.features = None
+        self.bdm_index = None
+        self.source_bdm_index = None
+        self.dirty = set()
+        self.dirty_entries = defaultdict(set)
+        self.saved_as = None
+        # Bumped whenever a paste is applied or the links are reset, so old plans can't be applied anymore
+        self.generation = 0
+        self.undo_edits = []
+        self.redo_edits = []
+        # Bumped whenever the links are reset, undoing an older edit doesn't bring its links back then
+        self.links_epoch = 0
+
+    # Called whenever either moveset is (re)loaded, the links only make sense for one pair of movesets
+    def reset(self):
+        self.generation += 1
+        self.links_epoch += 1
+        self.links = new_links()
+        self.linked_values = defaultdict(set)
+        self.source_bdm_index = None
+
+    # Called when a new target moveset is loaded from dirname
+    def reset_target(self, dirname):
+        self.reset()
+        self.reindex(self.target.hashes)
+        self.clear_history()
+        self.dirty = set()
+        self.dirty_entries = defaultdict(set)
+        self.saved_as = self.location(dirname, self.target.code)
+
+    def reindex(self, hashes):
+        self.references = ReferenceIndex(self.target.bac, PASTE_TYPES)
+        # The animation indices are built on first use, so a lazily loaded EAN isn't decoded just by opening it
+        self.animation_indices = {}
+        self.loaded_hashes = dict(hashes)
+        self.bdm_index = BdmIndex(self.target.bdm) if self.target.bdm is not None else None
+
+    @staticmethod
+    def location(dirname, code):
+        return os.path.normcase(os.path.abspath(dirname)), code
+
+    def animation_index(self, attr):
+        if attr not in self.animation_indices:
+            ean = getattr(self.target, attr) if attr in ANIMATION_FILES else None
+            if ean is None:
+                return None
+            hashes = self.loaded_hashes.pop(attr, None)
+            self.animation_indices[attr] = AnimationIndex(
+                decoded(ean), hashes if hashes is not None else ean_hashes(ean))
+        return self.animation_indices[attr]
+
+    def update_animation_index(self, item_type, index, animation_hash=None):
+        animation_index = self.animation_index(ITEM_FILES[item_type])
+        if animation_index is not None:
+            animation_index.update(index, animation_hash)
+
+    def source_hashes(self, attr):
+        source_hashes = self.source.hashes.get(attr)
+        if source_hashes is None:
+            source_hashes = self.source.hashes[attr] = ean_hashes(getattr(self.source, attr))
+        return source_hashes
+
+    def copied_hash(self, attr, old_value):
+        # A copy has the content of the source animation, so it also has its hash as long as the bones are the same
+        animation_index = self.animation_index(attr)
+        if animation_index is None or skeleton_key(decoded(getattr(self.source, attr))) != animation_index.key:
+            return None
+        return self.source_hashes(attr)[old_value]
+
+    def mark_dirty(self, attr, index):
+        self.dirty.add(attr)
+        self.dirty_entries[attr].add(index)
+
+    def files_to_save(self, dirname, code):
+        attrs = [attr for attr in MOVESET_ATTRS if getattr(self.target, attr) is not None]
+        # Everything has to be written out when saving somewhere else
+        if self.location(dirname, code) != self.saved_as:
+            return attrs
+        return [attr for attr in attrs if attr in self.dirty]
+
+    def mark_saved(self, dirname, code):
+        self.dirty = set()
+        self.dirty_entries = defaultdict(set)
+        self.saved_as = self.location(dirname, code)
+
+    def find_next_available_index(self, item_type):
+        if item_type == Animation:
+            return len(self.target.ean.animations)
+        elif item_type == Hitbox:
+            return self.bdm_index.max_id + 1
+        elif item_type == Camera:
+            return len(self.target.cam_ean.animations)
+        else:
+            raise(TypeError(f'Unsupported type: {item_type.__name__}'))
+
+    @perf.timed('create_new_index')
+    def create_new_index(self, item_type):
+        new_value = self.find_next_available_index(item_type)
+        if item_type == Animation:
+            animation = EanAnimation(decoded(self.target.ean))
+            self.target.ean.animations.append(animation)
+        elif item_type == Hitbox:
+            entry = BdmEntry(entry_id=new_value)
+            self.target.bdm.entries.append(entry)
+            self.bdm_index.add(entry)
+        elif item_type == Camera:
+            self.target.cam_ean.animations.append(EanAnimation(decoded(self.target.cam_ean)))
+        else:
+            raise(TypeError(f'Unsupported type: {item_type.__name__}'))
+        self.mark_dirty(ITEM_FILES[item_type], new_value)
+        self.update_animation_index(item_type, new_value)
+        return new_value
+
+    @staticmethod
+    def file_not_found(filename):
+        return PasteError(f'{filename} was not opened. Please add it and reload the moveset')
+
+    @staticmethod
+    def invalid_index(filename, index):
+        return PasteError(f'{filename} does not contain index {index}')
+
+    @perf.timed('copy_index')
+    def copy_index(self, item_type, old_value, new_value):
+        new_code = self.target.code
+        old_code = self.source.code
+        if item_type == Animation:
+            try:
+                animation = self.target.ean.animations[new_value]
+            except IndexError:
+                raise self.invalid_index(f'{new_code}.ean', new_value)
+            try:
+                animation.paste(self.source.ean.animations[old_value], keep_name=True)
+            except IndexError:
+                raise self.invalid_index(f'{old_code}.ean', old_value)
+            animation_hash = self.copied_hash('ean', old_value)
+
+        elif item_type == Hitbox:
+            if not self.target.bdm:
+                raise self.file_not_found(f'{new_code}_PLAYER.bdm')
+            if not self.source.bdm:
+                raise self.file_not_found(f'{old_code}_PLAYER.bdm')
+            if self.source_bdm_index is None:
+                self.source_bdm_index = BdmIndex(self.source.bdm)
+            entry = self.bdm_index.get(new_value)
+            if entry is None:
+                raise self.invalid_index(f'{new_code}_PLAYER.bdm', new_value)
+            old_entry = self.source_bdm_index.get(old_value)
+            if old_entry is None:
+                raise self.invalid_index(f'{old_code}_PLAYER.bdm', old_value)
+            entry.paste(old_entry)
+        elif item_type == Camera:
+            if not self.target.cam_ean:
+                raise self.file_not_found(f'{new_code}.cam.ean')
+            if not self.source.cam_ean:
+                raise self.file_not_found(f'{old_code}.cam.ean')
+            try:
+                camera = self.target.cam_ean.animations[new_value]
+            except IndexError:
+                raise self.invalid_index(f'{new_code}.cam.ean', new_value)
+            try:
+                camera.paste(self.source.cam_ean.animations[old_value], keep_name=True)
+            except IndexError:
+                raise self.invalid_index(f'{old_code}.cam.ean', old_value)
+            animation_hash = self.copied_hash('cam_ean', old_value)
+        else:
+            raise(TypeError(f'Unsupported type: {item_type.__name__}'))
+        self.mark_dirty(ITEM_FILES[item_type], new_value)
+        if item_type != Hitbox:
+            self.update_animation_index(item_type, new_value, animation_hash)
+
+    @staticmethod
+    def animation_name(ean, index):
+        # Names of a lazily loaded EAN are known without decoding it
+        if isinstance(ean, LazyEan):
+            return ean.animation_name(index)
+        if ean is None or not 0 <= index < len(ean.animations):
+            return ''
+        return ean.animations[index].name
+
+    def changed_value(self, entry_index, changed_values, item_type, old_value, new_value, status='new'):
+        old_name = new_name = ''
+        if item_type == Animation:
+            old_name = self.animation_name(self.source.ean, old_value)
+            if status != 'new':
+                new_name = self.animation_name(self.target.ean, new_value)
+        changed_values[item_type].append(ChangedValue(
+            entry_index, item_type, old_value, new_value, old_name, new_name, status))
+
+    @staticmethod
+    def character_values(copied_val):
+        # Example:
+        # Item type: Animation
+        # entry: Index
+        # dependency: Type
+        # depend_value: 5
+        # entry_values: {1, 2, 3}
+        for item_type, v1 in copied_val.items():
+            if item_type not in PASTE_TYPES:
+                continue
+            for entry_pair, v2 in v1.items():
+                for depend_value, entry_values in v2.items():
+                    # Skip if dependency isn't a character
+                    if item_type.dependencies[entry_pair][depend_value] != 'Character':
+                        continue
+                    yield item_type, entry_pair, depend_value, entry_values
+
+    def plan_paste(self, copied, selected_data):
+        if len(selected_data) < len(copied):
+            raise PasteError(f'Not enough entries to paste over. Expected {len(copied)}')
+        selected_data = selected_data[:len(copied)]
+        selected_ids = {id(entry) for entry in selected_data}
+
+        planner = PastePlanner(self)
+        planner.get_changed_values([
+            (copied_data, selected_entry.index, selected_entry.get_static_values())
+            for copied_data, selected_entry in zip(copied, selected_data)], selected_ids)
+        return planner.plan(copied, selected_data)
+
+    def plan_add(self, copied):
+        index_start = len(self.target.bac.entries)
+
+        # same as in plan_paste(), but it compares to the added entry
+        planner = PastePlanner(self)
+        for n, copied_data in enumerate(copied):
+            for item_type, entry_pair, depend_value, entry_values in self.character_values(
+                    copied_data.get_static_values()):
+                planner.get_added_values(index_start + n, item_type, entry_pair, depend_value, entry_values)
+        return planner.plan(copied, None)
+
+    # Writes everything a plan worked out in one go. Plans are only valid for the state they were made in.
+    def apply(self, plan):
+        if plan.generation != self.generation:
+            raise PasteError('The moveset changed after this paste was planned, please try again')
+        action = 'Add' if plan.selected is None else 'Paste'
+        edit = Edit(f'{action} {len(plan.copied)} entry(s)', self.links, self.linked_values, self.links_epoch)
+        for item_type, new_values in plan.new_indices.items():
+            attr = ITEM_FILES[item_type]
+            start = len(self.items(attr))
+            for _ in new_values:
+                self.create_new_index(item_type)
+            edit.appended[attr] = (start, self.items(attr)[start:])
+        backed_up = set()
+        for item_type, old_value, new_value in plan.copies:
+            if new_value not in plan.new_indices.get(item_type, ()) and (item_type, new_value) not in backed_up:
+                backed_up.add((item_type, new_value))
+                self.back_up(edit, ITEM_FILES[item_type], new_value)
+            self.copy_index(item_type, old_value, new_value)
+        self.links = plan.links
+        self.linked_values = plan.linked_values
+        edit.new_links = (self.links, self.linked_values)
+        self.generation += 1
+
+        pairs = []
+        if plan.selected is not None:
+            # Finally copy BAC Entries
+            entries = plan.selected
+            for copied_data, entry in zip(plan.copied, entries):
+                if id(entry) not in backed_up:
+                    backed_up.add(id(entry))
+                    edit.replaced.append(('bac', entry.index, entry, self.snapshot('bac', entry)))
+                pairs.append((entry.index, copied_data.index))
+                entry.paste(copied_data, self.links)
+                self.references.update_entry(entry)
+                self.mark_dirty('bac', entry.index)
+        else:
+            # Add BAC Entry, at the end so we don't override important CMN entries
+            entries = []
+            index_start = len(self.target.bac.entries)
+            for n, copied_data in enumerate(plan.copied):
+                new_entry = Entry(self.target.bac, index_start + n)
+                new_entry.paste(copied_data, self.links)
+                self.target.bac.entries.append(new_entry)
+                self.references.add_entry(new_entry)
+                self.mark_dirty('bac', new_entry.index)
+                pairs.append((new_entry.index, copied_data.index))
+                entries.append(new_entry)
+            edit.appended['bac'] = (index_start, entries)
+        self.undo_edits.append(edit)
+        self.redo_edits = []
+        return PasteResult(pairs, entries, plan.changed_values)
+
+    def paste(self, copied, selected_data):
+        return self.apply(self.plan_paste(copied, selected_data))
+
+    def add(self, copied):
+        return self.apply(self.plan_add(copied))
+
+    def items(self, attr):
+        obj = getattr(self.target, attr)
+        return obj.entries if attr in ('bac', 'bdm') else obj.animations
+
+    def snapshot(self, attr, obj):
+        # Detached copy of a BAC entry, animation or hitbox
+        if attr == 'bac':
+            copy = Entry(self.target.bac, obj.index)
+            copy.paste(obj, identity_links(obj))
+        elif attr == 'bdm':
+            copy = BdmEntry(entry_id=obj.id)
+            copy.paste(obj)
+        else:
+            copy = EanAnimation(decoded(getattr(self.target, attr)))
+            copy.paste(obj)
+        return copy
+
+    def back_up(self, edit, attr, index):
+        obj = self.bdm_index.get(index) if attr == 'bdm' else self.items(attr)[index]
+        edit.replaced.append((attr, index, obj, self.snapshot(attr, obj)))
+        if attr in self.animation_indices:
+            edit.hashes[(attr, index)] = self.animation_indices[attr].hashes[index]
+
+    def clear_history(self):
+        self.undo_edits = []
+        self.redo_edits = []
+
+    # Both return the edit undone/redone, or None if there is nothing to
+    def undo(self):
+        if not self.undo_edits:
+            return None
+        edit = self.undo_edits.pop()
+        self.swap(edit)
+        self.redo_edits.append(edit)
+        return edit
+
+    def redo(self):
+        if not self.redo_edits:
+            return None
+        edit = self.redo_edits.pop()
+        self.swap(edit)
+        self.undo_edits.append(edit)
+        return edit
+
+    # Puts the moveset on the other side of an edit. Overwritten objects swap contents with their copies, so the
+    # same edit can go back and forth.
+    def swap(self, edit):
+        if edit.undone:
+            for attr, (start, objects) in edit.appended.items():
+                self.append_items(attr, objects, edit.appended_hashes.pop(attr, None))
+        for n, (attr, index, obj, copy) in enumerate(edit.replaced):
+            current = self.snapshot(attr, obj)
+            if attr == 'bac':
+                obj.paste(copy, identity_links(copy))
+                self.references.update_entry(obj)
+            else:
+                obj.paste(copy)
+            edit.replaced[n] = (attr, index, obj, current)
+            self.mark_dirty(attr, index)
+            if attr in ANIMATION_FILES and attr in self.animation_indices:
+                animation_index = self.animation_indices[attr]
+                current_hash = animation_index.hashes[index] if index < len(animation_index.hashes) else None
+                animation_index.update(index, edit.hashes.get((attr, index)))
+                edit.hashes[(attr, index)] = current_hash
+        if not edit.undone:
+            for attr, (start, objects) in edit.appended.items():
+                removed_hashes = self.remove_items(attr, start)
+                if removed_hashes is not None:
+                    edit.appended_hashes[attr] = removed_hashes
+
+        # Links made for another source moveset don't mean anything anymore
+        if edit.links_epoch == self.links_epoch:
+            self.links, self.linked_values = edit.new_links if edit.undone else edit.links
+        edit.undone = not edit.undone
+        self.generation += 1
+
+    def append_items(self, attr, objects, hashes=None):
+        items = self.items(attr)
+        for n, obj in enumerate(objects):
+            items.append(obj)
+            if attr == 'bac':
+                self.references.add_entry(obj)
+            elif attr == 'bdm':
+                self.bdm_index.add(obj)
+            index = obj.id if attr == 'bdm' else len(items) - 1
+            self.mark_dirty(attr, index)
+            if attr in ANIMATION_FILES and attr in self.animation_indices:
+                self.animation_indices[attr].update(index, hashes[n] if hashes and n < len(hashes) else None)
+
+    # Returns the content hashes of the animations removed, if they were known
+    def remove_items(self, attr, start):
+        items = self.items(attr)
+        removed_hashes = None
+        for obj in items[start:]:
+            if attr == 'bac':
+                self.references.remove_entry(obj)
+                self.dirty_entries[attr].discard(obj.index)
+            elif attr == 'bdm':
+                self.bdm_index.remove(obj)
+                self.dirty_entries[attr].discard(obj.id)
+        if attr in ANIMATION_FILES:
+            self.dirty_entries[attr].difference_update(range(start, len(items)))
+            if attr in self.animation_indices:
+                removed_hashes = self.animation_indices[attr].truncate(start)
+        del items[start:]
+        self.dirty.add(attr)
+        return removed_hashes
+
+    # Existing target animations close to the ones that had to be added, so they can be reused by hand. Returns
+    # item type -> old value -> [(target index, difference)]. Not part of a paste, the GUI asks for it afterwards.
+    @perf.timed('similar_animations')
+    def similar_animations(self, changed_values):
+        suggestions = {}
+        if self.features is None:
+            if not similarity.available():
+                return suggestions
+            self.features = similarity.FeatureIndex()
+        for item_type in [Animation, Camera]:
+            attr = ITEM_FILES[item_type]
+            source_ean, target_ean = getattr(self.source, attr), getattr(self.target, attr)
+            old_values = sorted({value.old_value for value in changed_values.get(item_type, [])
+                                 if value.status == 'new'})
+            if not old_values or source_ean is None or target_ean is None:
+                continue
+            # Whatever this paste wrote or reused is left out, the new copies would match themselves
+            written = {value.new_value for value in changed_values[item_type]}
+            candidates = [index for index in range(len(target_ean.animations)) if index not in written]
+            # Bone by bone when both have the same bones, otherwise only roughly
+            source_ean, target_ean = decoded(source_ean), decoded(target_ean)
+            per_bone = bool(similarity.bone_names(source_ean)) and skeleton_key(source_ean) == skeleton_key(target_ean)
+            queries = self.features.matrix(source_ean, self.source_hashes(attr), old_values, per_bone)
+            matrix = self.features.matrix(target_ean, self.animation_index(attr).hashes, candidates, per_bone)
+            suggestions[item_type] = similarity.suggest(queries, matrix, old_values, candidates)
+        return suggestions
+
+    # Removes animations and BDM entries no BAC entry uses any more. Returns the number removed per file.
+    def compact(self):
+        removed = {}
+        hashes = {}
+        for item_type in [Animation, Camera]:
+            attr = ITEM_FILES[item_type]
+            ean = getattr(self.target, attr)
+            if ean is None:
+                continue
+            animation_index = self.animation_index(attr)
+            count = len(ean.animations)
+            live, changed_entries = compact_animations(self.target.bac, ean, item_type)
+            hashes[attr] = [animation_index.hashes[old] for old in live]
+            if len(live) == count:
+                continue
+            removed[attr] = count - len(live)
+            self.dirty.add(attr)
+            # Everything that moved differs from what is at its new index in the file now
+            self.dirty_entries[attr] = {
+                new for new, old in enumerate(live) if new != old or old in self.dirty_entries[attr]}
+            for index in changed_entries:
+                self.mark_dirty('bac', index)
+
+        if self.target.bdm is not None:
+            removed_ids = compact_bdm(self.target.bac, self.target.bdm)
+            if removed_ids:
+                removed['bdm'] = len(removed_ids)
+                self.dirty.add('bdm')
+                self.dirty_entries['bdm'].difference_update(removed_ids)
+
+        # Indices moved around, so old links and edits can't be trusted anymore
+        if removed:
+            self.clear_history()
+            self.reset()
+            self.reindex(hashes)
+        return removed
+
+
+class PastePlanner:
+    # Works out a paste without touching the moveset. Links, new indices and copied animations are tracked on top
+    # of the session's state, so throwing the plan away costs nothing.
+    def __init__(self, session):
+        self.session = session
+        self.target = session.target
+        self.source = session.source
+        self.links = new_links()
+        for item_type, v1 in session.links.items():
+            for entry_pair, v2 in v1.items():
+                for depend_value, v3 in v2.items():
+                    self.links[item_type][entry_pair][depend_value] = dict(v3)
+        self.linked_values = defaultdict(set, {key: set(values) for key, values in session.linked_values.items()})
+        self.changed_values = defaultdict(list)
+        self.next_index = {}
+        self.new_indices = defaultdict(list)
+        self.copies = []
+        self.conflicts = []
+        # attr -> content hash -> target indices this plan writes that content to, and index -> content hash
+        self.written_hashes = defaultdict(lambda: defaultdict(set))
+        self.written = defaultdict(dict)
+
+    def plan(self, copied, selected):
+        return PastePlan(
+            tuple(copied), tuple(selected) if selected is not None else None,
+            {item_type: tuple(values) for item_type, values in self.new_indices.items()}, tuple(self.copies),
+            self.links, self.linked_values, dict(self.changed_values), tuple(self.conflicts), self.added_bytes(),
+            self.session.generation)
+
+    def added_bytes(self):
+        # Only known for animations coming from a lazily loaded EAN, those have the size of every animation
+        added = {}
+        for item_type, new_values in self.new_indices.items():
+            attr = ITEM_FILES[item_type]
+            ean = getattr(self.source, attr)
+            sizes = ean.animation_sizes() if isinstance(ean, LazyEan) else None
+            old_values = [old_value for copy_type, old_value, new_value in self.copies
+                          if copy_type == item_type and new_value in new_values]
+            if sizes is None or any(old_value >= len(sizes) or sizes[old_value] is None for old_value in old_values):
+                added[attr] = None
+            else:
+                added[attr] = sum(sizes[old_value] for old_value in old_values)
+        return added
+
+    def link(self, item_type, entry_pair, depend_value, old_value, new_value):
+        self.links[item_type][entry_pair][depend_value][old_value] = new_value
+        self.linked_values[(item_type, entry_pair, depend_value)].add(new_value)
+
+    def find_conflict(self, item_type, entry_pair, depend_value, selected_ids, value):
+        perf.count('find_conflict')
+        if value in self.linked_values[(item_type, entry_pair, depend_value)]:
+            return True
+        # Entries in the selected data are being replaced, so their references don't count
+        return self.session.references.is_referenced((item_type, entry_pair, depend_value, value), selected_ids)
+
+    def create_new_index(self, item_type):
+        attr = ITEM_FILES[item_type]
+        if getattr(self.target, attr) is None:
+            raise self.session.file_not_found(MOVESET_FILENAMES[attr].format(code=self.target.code))
+        if item_type not in self.next_index:
+            self.next_index[item_type] = self.session.find_next_available_index(item_type)
+        new_value = self.next_index[item_type]
+        self.next_index[item_type] += 1
+        self.new_indices[item_type].append(new_value)
+        return new_value
+
+    def find_identical(self, item_type, old_value):
+        attr = ITEM_FILES[item_type]
+        animation_index = self.session.animation_index(attr)
+        source_ean = getattr(self.source, attr)
+        if animation_index is None or source_ean is None or not 0 <= old_value < len(source_ean.animations):
+            return None
+        animation_hash = self.session.source_hashes(attr)[old_value]
+        # The lowest index with that content once this plan is written
+        written = self.written[attr]
+        indices = [index for index in animation_index.indices.get(animation_hash, ()) if index not in written]
+        indices.extend(self.written_hashes[attr][animation_hash])
+        return min(indices) if indices else None
+
+    def is_valid_target(self, item_type, new_value):
+        if new_value in self.new_indices[item_type]:
+            return True
+        if item_type == Hitbox:
+            return self.session.bdm_index.get(new_value) is not None
+        return 0 <= new_value < len(getattr(self.target, ITEM_FILES[item_type]).animations)
+
+    def copy_index(self, item_type, old_value, new_value):
+        # Same checks as MovesetSession.copy_index, so applying the plan can't fail halfway
+        session = self.session
+        new_code = self.target.code
+        old_code = self.source.code
+        if item_type == Animation:
+            if not self.is_valid_target(item_type, new_value):
+                raise session.invalid_index(f'{new_code}.ean', new_value)
+            if not 0 <= old_value < len(self.source.ean.animations):
+                raise session.invalid_index(f'{old_code}.ean', old_value)
+        elif item_type == Hitbox:
+            if not self.target.bdm:
+                raise session.file_not_found(f'{new_code}_PLAYER.bdm')
+            if not self.source.bdm:
+                raise session.file_not_found(f'{old_code}_PLAYER.bdm')
+            if session.source_bdm_index is None:
+                session.source_bdm_index = BdmIndex(self.source.bdm)
+            if not self.is_valid_target(item_type, new_value):
+                raise session.invalid_index(f'{new_code}_PLAYER.bdm', new_value)
+            if session.source_bdm_index.get(old_value) is None:
+                raise session.invalid_index(f'{old_code}_PLAYER.bdm', old_value)
+        elif item_type == Camera:
+            if not self.target.cam_ean:
+                raise session.file_not_found(f'{new_code}.cam.ean')
+            if not self.source.cam_ean:
+                raise session.file_not_found(f'{old_code}.cam.ean')
+            if not self.is_valid_target(item_type, new_value):
+                raise session.invalid_index(f'{new_code}.cam.ean', new_value)
+            if not 0 <= old_value < len(self.source.cam_ean.animations):
+                raise session.invalid_index(f'{old_code}.cam.ean', old_value)
+        else:
+            raise(TypeError(f'Unsupported type: {item_type.__name__}'))
+        self.copies.append((item_type, old_value, new_value))
+
+        attr = ITEM_FILES[item_type]
+        if attr in ANIMATION_FILES and self.session.animation_index(attr) is not None:
+            old_hash = self.written[attr].get(new_value)
+            if old_hash is not None:
+                self.written_hashes[attr][old_hash].discard(new_value)
+            animation_hash = self.session.source_hashes(attr)[old_value]
+            self.written[attr][new_value] = animation_hash
+            self.written_hashes[attr][animation_hash].add(new_value)
+
+    # Returns the target index for old_value and whether it still has to be copied there
+    def new_index(self, entry_index, item_type, old_value):
+        new_value = self.find_identical(item_type, old_value)
+        if new_value is not None:
+            self.session.changed_value(entry_index, self.changed_values, item_type, old_value, new_value, 'identical')
+            return new_value, False
+        new_value = self.create_new_index(item_type)
+        self.session.changed_value(entry_index, self.changed_values, item_type, old_value, new_value)
+        return new_value, True
+
+    # Works out the target value of every character value of the copied entries at once. Within each kind of value,
+    # the values the selected entries use now are matched to the copied ones so as many as possible are reused
+    # instead of appended. pairs is (copied entry, selected entry index, selected static values) per entry pasted.
+    @perf.timed('get_changed_values')
+    def get_changed_values(self, pairs, selected_ids):
+        groups = defaultdict(list)
+        candidates = defaultdict(dict)
+        for pair, (copied_data, entry_index, selected_val) in enumerate(pairs):
+            entry_name = KNOWN_ENTRIES.get(entry_index, 'Unknown')
+            for item_type, entry_pair, depend_value, entry_values in self.session.character_values(
+                    copied_data.get_static_values()):
+                key = (item_type, entry_pair, depend_value)
+                for old_value in entry_values:
+                    if not self.is_blacklisted(item_type, self.source.ean, old_value, entry_name):
+                        groups[key].append((entry_index, old_value, pair))
+                if pair not in candidates[key] and entry_pair in selected_val.get(item_type, {}):
+                    candidates[key][pair] = (entry_index,) + self.valid_candidates(
+                        key, entry_index, selected_val[item_type][entry_pair][depend_value], selected_ids)
+
+        for key, occurrences in groups.items():
+            self.assign_group(key, occurrences, candidates[key])
+
+    def is_blacklisted(self, item_type, ean, value, entry_name):
+        if item_type != Animation:
+            return False
+        name = self.session.animation_name(ean, value)
+        return any(word in name for word in BLACKLISTED_WORDS) and not name.endswith(entry_name)
+
+    # (values any copied value can overwrite, values only the entry's own copied values can overwrite, values that
+    # can't be overwritten because something else uses them)
+    def valid_candidates(self, key, entry_index, values, selected_ids):
+        item_type, entry_pair, depend_value = key
+        entry_name = KNOWN_ENTRIES.get(entry_index, 'Unknown')
+        free, owned, conflicts = [], [], []
+        for value in values:
+            if self.is_blacklisted(item_type, self.target.ean, value, entry_name):
+                continue
+            # Animations named after the entry belong to it, even when something else uses them too
+            if item_type == Animation and self.session.animation_name(self.target.ean, value).endswith(entry_name):
+                owned.append(value)
+            elif self.find_conflict(item_type, entry_pair, depend_value, selected_ids, value):
+                conflicts.append(value)
+            else:
+                free.append(value)
+        return free, owned, conflicts
+
+    def assign_group(self, key, occurrences, candidates):
+        item_type, entry_pair, depend_value = key
+        links = self.links[item_type][entry_pair][depend_value]
+        changed_value = self.session.changed_value
+
+        # Every value still needing a target, with the values it can take: those of the entries it is pasted into
+        # that belong to them, then the free values of all the selected entries
+        owned = {value for _, _, entry_owned, _ in candidates.values() for value in entry_owned}
+        pool = list(dict.fromkeys(
+            value for _, free, _, _ in candidates.values() for value in free if value not in owned))
+        edges = defaultdict(list)
+        first = {}
+        for entry_index, old_value, pair in occurrences:
+            if old_value in links:
+                continue
+            first.setdefault(old_value, entry_index)
+            entry_owned = candidates[pair][2] if pair in candidates else []
+            edges[old_value].extend(value for value in entry_owned if value not in edges[old_value])
+        for old_value in edges:
+            edges[old_value].extend(value for value in pool if value not in edges[old_value])
+        # Values that are identical to something in the target already cost nothing when left unmatched, so they
+        # come last
+        left = sorted(edges, key=lambda old_value: self.find_identical(item_type, old_value) is not None)
+        matched = max_matching(left, edges)
+
+        for old_value, new_value in matched.items():
+            changed_value(first[old_value], self.changed_values, item_type, old_value, new_value, 'reused')
+            self.copy_index(item_type, old_value, new_value)
+            self.link(item_type, entry_pair, depend_value, old_value, new_value)
+        if len(matched) < len(edges):
+            for entry_index, _, _, conflicts in candidates.values():
+                self.conflicts.extend((item_type, entry_index, value) for value in conflicts)
+
+        # Everything else is linked to what it was linked to before, an identical animation or a new index. The
+        # occurrence a match was reported for is skipped by its entry too, the same value can come up in entries
+        # without candidates as well.
+        reported = {(first[old_value], old_value) for old_value in matched}
+        for entry_index, old_value, _ in occurrences:
+            if (entry_index, old_value) in reported:
+                reported.remove((entry_index, old_value))
+                continue
+            if old_value in links:
+                changed_value(entry_index, self.changed_values, item_type, old_value, links[old_value], 'reused')
+                continue
+            new_value, copy = self.new_index(entry_index, item_type, old_value)
+            if copy:
+                self.copy_index(item_type, old_value, new_value)
+            self.link(item_type, entry_pair, depend_value, old_value, new_value)
+
+    @perf.timed('get_added_values')
+    def get_added_values(self, entry_index, item_type, entry_pair, depend_value, entry_values):
+        for old_value in entry_values:
+            # If we have a link already, use that
+            if old_value in self.links[item_type][entry_pair][depend_value]:
+                new_value = self.links[item_type][entry_pair][depend_value][old_value]
+                self.session.changed_value(entry_index, self.changed_values, item_type, old_value, new_value, 'reused')
+                continue
+            # Otherwise, just create a new one unless the animation is already there
+            new_value, copy = self.new_index(entry_index, item_type, old_value)
+
+            # Copy EAN/BDM entries
+            if copy:
+                self.copy_index(item_type, old_value, new_value)
+            self.link(item_type, entry_pair, depend_value, old_value, new_value)
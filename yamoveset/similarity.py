@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from itertools import chain
+from operator import attrgetter
+import zlib
+
+# NumPy is only imported once it is needed, importing it takes a noticeable part of startup
+np = None
+
+# Every keyframe track is resampled to SAMPLES points over the length of its animation. Between EANs with the same
+# skeleton every bone gets its own rows in skeleton order, one per component (position, rotation, scale) as told
+# apart by the track flag. Animations of different skeletons can only be compared by summing their tracks
+# into one of SLOTS slots by bone name and component, which mixes up unrelated bones.
+SAMPLES = 8
+COMPONENTS = 3
+SLOTS = 64
+# Root mean square difference of the resampled values that still counts as similar
+SIMILAR_RMS = 0.05
+MAX_SUGGESTIONS = 3
+KEYFRAME_VALUES = attrgetter('frame', 'x', 'y', 'z', 'w')
+# Feature vectors kept for reuse, the least recently used ones go first
+MAX_CACHED_BYTES = 64 * 1024 ** 2
+
+
+def available():
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return False
+    return True
+
+
+def bone_names(ean):
+    bones = getattr(getattr(ean, 'skeleton', None), 'bones', None) or []
+    return [getattr(bone, 'name', str(index)) for index, bone in enumerate(bones)]
+
+
+def node_bone(node, bones):
+    name = getattr(node, 'bone_name', None)
+    if name is not None:
+        return name
+    index = getattr(node, 'bone_index', None)
+    if index is not None and 0 <= index < len(bones):
+        return bones[index]
+    return str(index)
+
+
+def track_row(bone, flag, rows):
+    # rows is bone name -> position in the skeleton for per bone features, None for hashed slots
+    if rows is None:
+        return zlib.crc32(f'{bone}/{flag}'.encode('utf-8')) % SLOTS
+    position = rows.get(bone)
+    return position * COMPONENTS + flag % COMPONENTS if position is not None else None
+
+
+def feature_rows(bones, per_bone):
+    return len(bones) * COMPONENTS if per_bone else SLOTS
+
+
+def animation_features(animation, bones, per_bone=False):
+    rows = {bone: position for position, bone in enumerate(bones)} if per_bone else None
+    slots, counts, tracks = [], [], []
+    for node in getattr(animation, 'nodes', []):
+        bone = node_bone(node, bones)
+        for track in getattr(node, 'keyframed_animations', []):
+            keyframes = getattr(track, 'keyframes', [])
+            row = track_row(bone, getattr(track, 'flag', 0), rows)
+            if keyframes and row is not None:
+                slots.append(row)
+                counts.append(len(keyframes))
+                tracks.append(keyframes)
+    features = np.zeros((feature_rows(bones, per_bone), SAMPLES, 4), dtype=np.float32)
+    if not tracks:
+        return features.ravel()
+
+    # The keyframes of every track are read into one array in a single pass, then all tracks are resampled at
+    # once. Every track gets its own range of keys so one sorted search finds the keyframes around each sample
+    # time of each track.
+    total = sum(counts)
+    data = np.fromiter(chain.from_iterable(map(KEYFRAME_VALUES, chain.from_iterable(tracks))), np.float64,
+                       5 * total).reshape(total, 5)
+    frames = data[:, 0]
+    counts = np.array(counts)
+    ends = np.cumsum(counts)[:, None]
+    starts = ends - counts[:, None]
+    first, last = frames.min(), frames.max()
+    # Resampling over the animation's own length makes the same move at a different speed come out the same
+    times = np.linspace(0, last or 1, SAMPLES)
+    span = last - first + times[-1] + 2
+    keys = np.repeat(np.arange(len(counts)), counts) * span + frames - first
+    sample_keys = np.arange(len(counts))[:, None] * span + (times - first)[None, :]
+    after = np.minimum(np.maximum(np.searchsorted(keys, sample_keys, side='right'), starts + 1), ends - 1)
+    before = np.maximum(after - 1, starts)
+    weight = np.clip((times - frames[before]) / np.maximum(frames[after] - frames[before], 1e-6), 0, 1)[..., None]
+    values = data[before, 1:] * (1 - weight) + data[after, 1:] * weight
+    np.add.at(features, np.array(slots), values.astype(np.float32))
+    return features.ravel()
+
+
+class FeatureIndex:
+    # (per bone, content hash) -> feature vector, so every distinct animation is only resampled once. The content
+    # hash already tells the skeletons apart.
+    def __init__(self, max_bytes=MAX_CACHED_BYTES):
+        if not available():
+            raise ImportError('NumPy is needed to compare animations')
+        self.features = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def get(self, key):
+        features = self.features.get(key)
+        if features is not None:
+            self.features.move_to_end(key)
+        return features
+
+    def put(self, key, features):
+        self.features[key] = features
+        self.size += features.nbytes
+        while self.size > self.max_bytes and len(self.features) > 1:
+            _, evicted = self.features.popitem(last=False)
+            self.size -= evicted.nbytes
+
+    # per_bone only gives comparable rows between EANs with the same skeleton
+    def matrix(self, ean, hashes, indices, per_bone=False):
+        bones = bone_names(ean)
+        matrix = np.empty((len(indices), feature_rows(bones, per_bone) * SAMPLES * 4), dtype=np.float32)
+        for row, index in enumerate(indices):
+            key = (per_bone, hashes[index])
+            features = self.get(key)
+            if features is None:
+                features = animation_features(ean.animations[index], bones, per_bone)
+                self.put(key, features)
+            matrix[row] = features
+        return matrix
+
+
+def nearest(queries, candidates, k=MAX_SUGGESTIONS):
+    # RMS difference between every query and candidate over the values either of them animates, all at once.
+    # Returns the indices of the k closest candidates and their differences, per query.
+    query_mask = (queries != 0).astype(np.float32)
+    candidate_mask = (candidates != 0).astype(np.float32)
+    used = query_mask.sum(1)[:, None] + candidate_mask.sum(1)[None, :] - query_mask @ candidate_mask.T
+    squared = (queries * queries).sum(1)[:, None] + (candidates * candidates).sum(1)[None, :] \
+        - 2 * queries @ candidates.T
+    rms = np.sqrt(np.maximum(squared, 0) / np.maximum(used, 1))
+    k = min(k, candidates.shape[0])
+    closest = np.argpartition(rms, k - 1, axis=1)[:, :k]
+    closest_rms = np.take_along_axis(rms, closest, axis=1)
+    order = np.argsort(closest_rms, axis=1)
+    return np.take_along_axis(closest, order, axis=1), np.take_along_axis(closest_rms, order, axis=1)
+
+
+# old value -> [(candidate value, rms)] of the candidates similar enough to suggest reusing
+def suggest(queries, candidates, old_values, candidate_values):
+    if not len(old_values) or not len(candidate_values):
+        return {}
+    closest, closest_rms = nearest(queries, candidates)
+    suggestions = {}
+    empty = ~queries.any(1)
+    for old_value, rows, rms_values, is_empty in zip(old_values, closest, closest_rms, empty):
+        if is_empty:
+            continue
+        similar = [(candidate_values[row], float(rms)) for row, rms in zip(rows, rms_values) if rms <= SIMILAR_RMS]
+        if similar:
+            suggestions[old_value] = similar
+    return suggestions